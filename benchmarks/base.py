@@ -0,0 +1,94 @@
+"""
+Common setup for the benchmarks. They use an in-memory SQLite database with
+Django's auth models and the fixture models in `benchmarks.models`, in the
+same way as `runtests.py`.
+"""
+import os, sys, time
+
+DIRNAME = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIRNAME))
+
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(DEBUG = False,
+                       DATABASES={
+                            'default': {
+                                  'ENGINE': 'django.db.backends.sqlite3',
+                                  'NAME': ':memory:',
+                            }
+                      },
+                       INSTALLED_APPS = ('django.contrib.auth',
+                                         'django.contrib.contenttypes',
+                                         'reportato',
+                                         'benchmarks',
+                                        )
+                       )
+
+
+def setup_database():
+    from django.core.management import call_command
+    call_command('syncdb', interactive=False, verbosity=0)
+
+
+def create_users(quantity):
+    from django.contrib.auth import get_user_model
+    User = get_user_model()
+    User.objects.bulk_create([
+        User(username='user%s' % i, first_name=u'Fr\xe9d %s' % i,
+             last_name='Bloggs %s' % (i % 100), email='%s@example.com' % i)
+        for i in xrange(quantity)
+    ], batch_size=500)
+
+
+def timed(func, *args, **kwargs):
+    """
+    Returns the time in seconds it takes to run `func`
+    """
+    start = time.time()
+    func(*args, **kwargs)
+    return time.time() - start
+
+
+def create_customers(quantity, countries=20, tags=50, tags_per_customer=3):
+    """
+    Creates `quantity` customers, each one with a country and some tags
+    """
+    import datetime
+    from decimal import Decimal
+    from benchmarks.models import Country, Customer, Tag
+
+    Country.objects.bulk_create([Country(name='Country %s' % i) for i in xrange(countries)])
+    Tag.objects.bulk_create([Tag(name='tag%s' % i) for i in xrange(tags)])
+    country_ids = list(Country.objects.values_list('pk', flat=True))
+    tag_ids = list(Tag.objects.values_list('pk', flat=True))
+
+    created = datetime.datetime(2014, 6, 1)
+    Customer.objects.bulk_create([
+        Customer(name=u'Customer %s' % i, email='%s@example.com' % i,
+                 balance=Decimal(i % 10000) / 100, active=i % 7 != 0,
+                 created=created + datetime.timedelta(minutes=i),
+                 notes=u'Some notes about customer n\xba%s' % i,
+                 country_id=country_ids[i % countries])
+        for i in xrange(quantity)
+    ], batch_size=500)
+
+    Through = Customer.tags.through
+    relations = []
+    for customer_id in Customer.objects.values_list('pk', flat=True).iterator():
+        for j in xrange(tags_per_customer):
+            relations.append(Through(customer_id=customer_id,
+                                     tag_id=tag_ids[(customer_id + j * 7) % tags]))
+        if len(relations) >= 5000:
+            Through.objects.bulk_create(relations, batch_size=500)
+            relations = []
+    Through.objects.bulk_create(relations, batch_size=500)
+
+
+def clear_customers():
+    from django.db import connection
+    from benchmarks.models import Country, Customer, Tag
+
+    cursor = connection.cursor()
+    for model in (Customer.tags.through, Customer, Country, Tag):
+        cursor.execute('DELETE FROM %s' % connection.ops.quote_name(model._meta.db_table))
@@ -0,0 +1,80 @@
+"""
+Compares rendering numeric and date columns one cell at a time with
+`get_FIELD_column` methods against rendering them a batch at a time with
+`get_FIELD_column_batch` methods.
+
+    $ python -m benchmarks.batch_columns [rows]
+"""
+import sys
+
+from benchmarks.base import create_customers, setup_database, timed
+
+from reportato.reporters import ModelReporter
+
+from benchmarks.models import Customer
+
+
+class PerCellCustomerReporter(ModelReporter):
+    class Meta:
+        model = Customer
+        fields = ('id', 'balance', 'created', 'active')
+        chunk_size = 5000
+
+    def get_balance_column(self, instance):
+        return u'{:,.2f}'.format(instance.balance)
+
+    def get_created_column(self, instance):
+        return unicode(instance.created.strftime('%Y-%m-%d'))
+
+    def get_active_column(self, instance):
+        return u'yes' if instance.active else u'no'
+
+
+class BatchCustomerReporter(ModelReporter):
+    class Meta:
+        model = Customer
+        fields = ('id', 'balance', 'created', 'active')
+        chunk_size = 5000
+        column_batch_size = 5000
+
+    def get_balance_column_batch(self, values):
+        format = u'{:,.2f}'.format
+        return [format(value) for value in values]
+
+    def get_created_column_batch(self, values):
+        # many rows share the same day, so each one is formatted once
+        days = {}
+        for value in values:
+            day = value.date()
+            if day not in days:
+                days[day] = unicode(day.strftime('%Y-%m-%d'))
+        return [days[value.date()] for value in values]
+
+    def get_active_column_batch(self, values):
+        return [u'yes' if value else u'no' for value in values]
+
+
+class ValuesListBatchCustomerReporter(BatchCustomerReporter):
+    class Meta(BatchCustomerReporter.Meta):
+        use_values_list = True
+
+
+def render(reporter_class):
+    for row in reporter_class().get_rows():
+        pass
+
+
+def main(quantity):
+    setup_database()
+    create_customers(quantity, tags_per_customer=0)
+
+    print 'rows: %s' % quantity
+    for reporter_class in (PerCellCustomerReporter, BatchCustomerReporter,
+                           ValuesListBatchCustomerReporter):
+        seconds = timed(render, reporter_class)
+        print '%-32s %7.2f us/row' % (reporter_class.__name__,
+                                      seconds * 1e6 / quantity)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
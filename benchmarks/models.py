@@ -0,0 +1,26 @@
+from django.db import models
+
+
+class Country(models.Model):
+    name = models.CharField(max_length=100)
+
+    def __unicode__(self):
+        return self.name
+
+
+class Tag(models.Model):
+    name = models.CharField(max_length=50)
+
+    def __unicode__(self):
+        return self.name
+
+
+class Customer(models.Model):
+    name = models.CharField(max_length=100)
+    email = models.EmailField()
+    balance = models.DecimalField(max_digits=10, decimal_places=2)
+    active = models.BooleanField(default=True)
+    created = models.DateTimeField()
+    notes = models.TextField(blank=True)
+    country = models.ForeignKey(Country)
+    tags = models.ManyToManyField(Tag)
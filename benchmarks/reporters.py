@@ -0,0 +1,33 @@
+from reportato.reporters import ModelReporter
+
+from benchmarks.models import Customer
+
+
+class CustomerReporter(ModelReporter):
+    """
+    Plain, foreign key, many to many and custom columns
+    """
+    class Meta:
+        model = Customer
+        fields = ('id', 'name', 'email', 'balance', 'active', 'created',
+                  'country', 'tags', 'display_name')
+
+    def get_display_name_column(self, instance):
+        return u'%s <%s>' % (instance.name, instance.email)
+
+
+class ChunkedCustomerReporter(CustomerReporter):
+    class Meta(CustomerReporter.Meta):
+        chunk_size = 5000
+
+
+class PlainCustomerReporter(ModelReporter):
+    class Meta:
+        model = Customer
+        fields = ('id', 'name', 'email', 'balance', 'active', 'created')
+        chunk_size = 5000
+
+
+class ValuesListCustomerReporter(PlainCustomerReporter):
+    class Meta(PlainCustomerReporter.Meta):
+        use_values_list = True
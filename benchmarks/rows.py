@@ -0,0 +1,55 @@
+"""
+Compares the per row cost of rendering a report dispatching every cell
+through `_render_field` with the compiled column renderers used by
+`ModelReporter.get_rows()`.
+
+    $ python -m benchmarks.rows [rows]
+"""
+import sys
+
+from benchmarks.base import create_users, setup_database, timed
+
+from django.contrib.auth import get_user_model
+from django.utils.datastructures import SortedDict
+
+from reportato.reporters import ModelReporter
+
+
+class UserReporter(ModelReporter):
+    class Meta:
+        model = get_user_model()
+        fields = ('id', 'username', 'first_name', 'last_name', 'email',
+                  'is_staff', 'date_joined', 'full_name')
+
+    def get_full_name_column(self, instance):
+        return instance.get_full_name()
+
+
+def per_cell_dispatch(reporter, items):
+    for item in items:
+        SortedDict([(name, reporter._render_field(item, name))
+                    for name in reporter.fields and reporter.visible_fields]).values()
+
+
+def compiled_renderers(reporter, items):
+    for row in reporter.get_rows():
+        pass
+
+
+def main(quantity):
+    setup_database()
+    create_users(quantity)
+    # render from memory, so only Python's cost is measured
+    items = list(get_user_model().objects.all())
+    reporter = UserReporter(items)
+
+    before = timed(per_cell_dispatch, reporter, items)
+    after = timed(compiled_renderers, reporter, items)
+
+    print 'rows: %s' % quantity
+    print 'per cell dispatch:   %.2f us/row' % (before * 1e6 / quantity)
+    print 'compiled renderers:  %.2f us/row' % (after * 1e6 / quantity)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
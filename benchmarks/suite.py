@@ -0,0 +1,204 @@
+"""
+Benchmark suite for reporters, writers and views. Measures rows per second,
+peak memory growth, number of queries and time to first byte, and saves the
+results as JSON so runs can be compared:
+
+    $ python -m benchmarks.suite --rows 10000 --rows 100000 --output new.json
+    $ python -m benchmarks.suite --rows 10000 --compare old.json
+
+Every case runs in a forked process, so their memory usage doesn't add up.
+"""
+import argparse, io, json, os, platform, resource, sys, time, traceback
+
+from benchmarks.base import clear_customers, create_customers, setup_database
+
+import django
+from django.db import connection
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from reportato.utils import BufferedUnicodeWriter, UnicodeWriter
+from reportato.views import BaseCSVGeneratorView
+
+from benchmarks.models import Customer
+from benchmarks.reporters import (
+    ChunkedCustomerReporter, CustomerReporter, PlainCustomerReporter,
+    ValuesListCustomerReporter)
+
+
+def _current_rss():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * resource.getpagesize()
+
+
+def _peak_rss():
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure(func):
+    """
+    Runs `func`, which returns the number of rows it processed and the time
+    of its first byte (or None), and returns its metrics
+    """
+    start_rss = _current_rss()
+    with CaptureQueriesContext(connection) as queries:
+        start = time.time()
+        rows, first_byte = func()
+        seconds = time.time() - start
+
+    return {
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_second': rows / seconds if seconds else None,
+        'peak_memory_growth': max(0, _peak_rss() - start_rss),
+        'queries': len(queries),
+        'time_to_first_byte': first_byte - start if first_byte else None,
+    }
+
+
+def run_isolated(func):
+    """
+    Measures `func` in a forked process, if possible
+    """
+    if not hasattr(os, 'fork'):  # pragma: no cover
+        return measure(func)
+
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        try:
+            result = measure(func)
+        except Exception:
+            result = {'error': traceback.format_exc()}
+        with os.fdopen(write_end, 'w') as pipe:
+            json.dump(result, pipe)
+        os._exit(0)
+
+    os.close(write_end)
+    with os.fdopen(read_end) as pipe:
+        result = json.load(pipe)
+    os.waitpid(pid, 0)
+    return result
+
+
+def reporter_case(reporter_class):
+    def run():
+        rows = 0
+        for row in reporter_class().get_rows():
+            rows += 1
+        return rows, None
+    return run
+
+
+def writer_case(writer_class, rows):
+    def run():
+        writer = writer_class(io.BytesIO())
+        writer.writerows(rows)
+        if hasattr(writer, 'close'):
+            writer.close()
+        return len(rows), None
+    return run
+
+
+def view_case(reporter_class, streaming, quantity):
+    class View(BaseCSVGeneratorView):
+        model = Customer
+
+    View.reporter_class = reporter_class
+    View.streaming = streaming
+    View.writer_class = BufferedUnicodeWriter
+
+    def run():
+        response = View.as_view()(RequestFactory().get('/'))
+        if not streaming:
+            # nothing is sent until the whole report is generated
+            return quantity, time.time()
+
+        first_byte = None
+        for chunk in response.streaming_content:
+            if first_byte is None:
+                first_byte = time.time()
+        return quantity, first_byte
+    return run
+
+
+def get_cases(quantity):
+    rows = list(CustomerReporter().get_rows())
+    return [
+        ('reporter.mixed', reporter_case(CustomerReporter)),
+        ('reporter.mixed_chunked', reporter_case(ChunkedCustomerReporter)),
+        ('reporter.plain', reporter_case(PlainCustomerReporter)),
+        ('reporter.plain_values_list', reporter_case(ValuesListCustomerReporter)),
+        ('writer.unicode', writer_case(UnicodeWriter, rows)),
+        ('writer.buffered', writer_case(BufferedUnicodeWriter, rows)),
+        ('view.buffered', view_case(ChunkedCustomerReporter, False, quantity)),
+        ('view.streaming', view_case(ChunkedCustomerReporter, True, quantity)),
+    ]
+
+
+def run_suite(quantities, only=None):
+    setup_database()
+    results = {}
+    for quantity in sorted(quantities):
+        clear_customers()
+        create_customers(quantity)
+        for name, case in get_cases(quantity):
+            if only and not any(name.startswith(prefix) for prefix in only):
+                continue
+            result = run_isolated(case)
+            results.setdefault(name, {})[str(quantity)] = result
+            print_result(name, quantity, result)
+    return results
+
+
+def print_result(name, quantity, result, previous=None):
+    if 'error' in result:
+        print '%-28s %8s  ERROR\n%s' % (name, quantity, result['error'])
+        return
+
+    line = '%-28s %8s %10.0f rows/s %8.1f MB %6s queries' % (
+        name, quantity, result['rows_per_second'] or 0,
+        result['peak_memory_growth'] / 1e6, result['queries'])
+    if result['time_to_first_byte'] is not None:
+        line += ' %8.1f ms TTFB' % (result['time_to_first_byte'] * 1000)
+    if previous and previous.get('rows_per_second'):
+        line += ' (%+.0f%%)' % (
+            (result['rows_per_second'] / previous['rows_per_second'] - 1) * 100)
+    print line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--rows', type=int, action='append',
+                        help='number of rows, can be repeated (default 10000)')
+    parser.add_argument('--only', action='append',
+                        help='only run the cases starting with this prefix')
+    parser.add_argument('--output', help='file to save the results as JSON')
+    parser.add_argument('--compare', help='JSON results of a previous run')
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.rows or [10000], args.only)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            previous = json.load(fh)['results']
+        print '\nCompared with %s:' % args.compare
+        for name in sorted(results):
+            for quantity, result in sorted(results[name].items()):
+                print_result(name, quantity, result,
+                             previous.get(name, {}).get(quantity))
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump({
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'timestamp': time.time(),
+                'results': results,
+            }, fh, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,44 @@
+"""
+Compares the throughput of `UnicodeWriter` and `BufferedUnicodeWriter`
+writing rendered rows into a `BytesIO`.
+
+    $ python -m benchmarks.writers [rows]
+"""
+import io, sys
+
+from benchmarks.base import timed
+
+from reportato.utils import BufferedUnicodeWriter, UnicodeWriter
+
+
+def make_rows(quantity):
+    return [
+        [unicode(i), u'user%s' % i, u'Fr\xe9d %s' % i, u'Bloggs %s' % i,
+         u'%s@example.com' % i, u'True', u'2014-06-01 12:00:00', u'']
+        for i in xrange(quantity)
+    ]
+
+
+def write(writer_class, rows, encoding):
+    fh = io.BytesIO()
+    writer = writer_class(fh, encoding=encoding)
+    writer.writerows(rows)
+    if hasattr(writer, 'close'):
+        writer.close()
+    return fh.tell()
+
+
+def main(quantity):
+    rows = make_rows(quantity)
+    print 'rows: %s' % quantity
+    for encoding in ('utf-8', 'utf-16'):
+        for writer_class in (UnicodeWriter, BufferedUnicodeWriter):
+            size = write(writer_class, rows, encoding)
+            seconds = timed(write, writer_class, rows, encoding)
+            print '%-22s %-7s %9.0f rows/s %7.1f MB/s' % (
+                writer_class.__name__, encoding, quantity / seconds,
+                size / seconds / 1e6)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
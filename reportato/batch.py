@@ -0,0 +1,161 @@
+"""
+Exports several reports of the same queryset in a single pass over it, e.g.
+different sets of visible fields of a reporter, or several reporters of the
+same model:
+
+    >>> queryset = MyModel.objects.filter(active=True)
+    >>> with open('full.csv', 'wb') as full, open('short.csv', 'wb') as short:
+    ...     export_batch([(MyReporter(queryset), full),
+    ...                   (MyReporter(queryset, ['id', 'name']), short)])
+
+The rows are fetched in chunks with the annotations and relations needed by
+every report, and every chunk is written to all the reports before fetching
+the next one.
+"""
+from django.db.models.query import QuerySet, prefetch_related_objects
+
+from .reporters import _add_related_lookups, _only_fields, iter_chunks
+from .utils import UnicodeWriter, batched, close_writer
+
+
+def _get_annotation_signature(expression):
+    if isinstance(expression, basestring):
+        return expression
+    return (type(expression), expression.lookup, sorted(expression.extra.items()))
+
+
+def get_batch_queryset(reporters):
+    """
+    Returns the queryset of the given reporters with the annotations and
+    related lookups needed by all of them, restricted to the union of the
+    fields they require, if known. Raises ValueError if they don't
+    share the same queryset, or define different annotations with the same
+    name
+    """
+    queryset = reporters[0].items
+    for reporter in reporters:
+        if not isinstance(reporter.items, QuerySet) or \
+                reporter.items.model is not queryset.model or \
+                unicode(reporter.items.query) != unicode(queryset.query):
+            raise ValueError('Reporters in a batch need the same queryset')
+
+    annotations = {}
+    select_related, prefetch_related = [], []
+    for reporter in reporters:
+        for name in reporter.visible_fields:
+            expression = reporter._meta.annotations.get(name)
+            if expression is None:
+                continue
+            previous = annotations.setdefault(name, expression)
+            if _get_annotation_signature(previous) != _get_annotation_signature(expression):
+                raise ValueError('Reporters in a batch define different annotations '
+                                 'named %s' % name)
+
+        reporter_select_related, reporter_prefetch_related = reporter.get_related_lookups()
+        select_related += [lookup for lookup in reporter_select_related
+                           if lookup not in select_related]
+        prefetch_related += [lookup for lookup in reporter_prefetch_related
+                             if lookup not in prefetch_related]
+
+    extra_select = dict((name, expression) for name, expression in annotations.items()
+                        if isinstance(expression, basestring))
+    if extra_select:
+        queryset = queryset.extra(select=extra_select)
+    aggregates = dict((name, expression) for name, expression in annotations.items()
+                      if name not in extra_select)
+    if aggregates:
+        queryset = queryset.annotate(**aggregates)
+
+    queryset = _add_related_lookups(queryset, select_related, prefetch_related)
+    return _only_fields(queryset, _get_required_fields(reporters),
+                        reporters[0]._get_local_field_names())
+
+
+def _get_required_fields(reporters):
+    """
+    Returns the union of the fields required by `reporters`, or None if any
+    of them can't be restricted
+    """
+    fields = set()
+    for reporter in reporters:
+        if not reporter._meta.only_required_fields:
+            return None
+        required = reporter.get_required_fields()
+        if required is None:
+            return None
+        fields.update(required)
+    return sorted(fields)
+
+
+def _get_row_renderer(reporter):
+    """
+    Returns a function rendering the row of an item for `reporter`, calling
+    its `get_row` if it's overridden
+    """
+    if reporter._overrides_get_row():
+        return lambda item: reporter.get_row(item).values()
+    renderers = reporter.get_column_renderers()
+    return lambda item: [render(item) for render in renderers]
+
+
+def export_batch(reports, chunk_size=1000, writer_class=UnicodeWriter,
+                 write_header=True):
+    """
+    Writes every report in `reports`, a list of `(reporter, fh)` tuples whose
+    reporters share the same queryset, with a single pass over it. Rows are
+    fetched `chunk_size` at a time, sorted by primary key, unless the
+    queryset is sliced. Reporters with an instrument are measured as if
+    they were exported on their own. Returns the number of rows of the
+    reports
+    """
+    reporters = [reporter for reporter, _ in reports]
+    queryset = get_batch_queryset(reporters)
+
+    # instruments started here, which are finished once every report is
+    instruments = []
+    try:
+        writers = []
+        for reporter, fh in reports:
+            instrument = reporter.instrument
+            if instrument is not None and instrument.started is None:
+                instrument.start(reporter, queryset.db)
+                instruments.append(instrument)
+            if instrument is not None:
+                fh = instrument.wrap_stream(fh)
+            writer = writer_class(fh)
+            if instrument is not None:
+                writer = instrument.wrap_writer(writer)
+            if write_header:
+                writer.writerow(reporter.get_header_row())
+            writers.append((writer, reporter, _get_row_renderer(reporter)))
+
+        prefetch_related = []
+        if queryset.query.can_filter():
+            items = iter_chunks(queryset, chunk_size, ['pk'], lambda item: (item.pk,))
+        else:
+            # `iterator()` ignores prefetches, so they're applied per chunk
+            prefetch_related = queryset._prefetch_related_lookups
+            items = queryset.iterator()
+
+        count = 0
+        for chunk in batched(items, chunk_size):
+            if prefetch_related:
+                prefetch_related_objects(chunk, prefetch_related)
+            count += len(chunk)
+            for writer, reporter, render_row in writers:
+                rows = (render_row(item) for item in chunk)
+                if reporter.instrument is not None:
+                    rows = reporter.instrument.track_rows(rows, reporter)
+                writer.writerows(rows)
+
+        for writer, _, _ in writers:
+            close_writer(writer)
+    except:
+        # in reverse order, so the connection gets its debug cursor back
+        for instrument in reversed(instruments):
+            instrument.stop()
+        raise
+
+    for instrument in reversed(instruments):
+        instrument.finish()
+    return count
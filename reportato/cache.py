@@ -0,0 +1,373 @@
+"""
+Caching of the encoded output of reports, used by
+`reportato.views.CachedReportMixin`. Entries are stored under a key built
+from the reporter class, the visible fields and a fingerprint of the SQL of
+the queryset, so the same report with the same filters is only generated
+once:
+
+    >>> report_cache = FileSystemReportCache('/var/cache/reports',
+    ...                                      max_size=500 * 1024 * 1024,
+    ...                                      timeout=60 * 60)
+
+Every watched model has a generation, which is part of the key and changes
+on `post_save` and `post_delete` of any of its instances, or when the many
+to many relations of its reporters change, so cached reports of a model are
+never served once it changes. Outdated entries are left to expire or to be
+evicted.
+"""
+import hashlib, io, json, os, tempfile, time, uuid
+
+from django.core.cache import get_cache
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .reporters import MANY_TO_MANY
+
+# headers of the response stored along with its content
+CACHED_HEADERS = ('Content-Type', 'Content-Disposition', 'Content-Encoding', 'Vary')
+
+
+def get_queryset_fingerprint(queryset):
+    """
+    Returns a hash of the SQL and parameters of `queryset`
+    """
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        # querysets that can't match any row, like `none()`
+        sql, params = None, ()
+    identity = [queryset.db, sql, list(params)]
+    return hashlib.sha1(json.dumps(identity, default=unicode)).hexdigest()
+
+
+def _get_model_label(model):
+    return '%s.%s' % (model._meta.app_label, model._meta.object_name.lower())
+
+
+def get_through_models(reporter_class):
+    """
+    Returns the intermediate models of the many to many fields of
+    `reporter_class`, in both directions
+    """
+    model = reporter_class._meta.model
+    through_models = []
+    for name in reporter_class.fields:
+        if reporter_class.field_kinds.get(name) != MANY_TO_MANY:
+            continue
+        field, _, direct, _ = model._meta.get_field_by_name(name)
+        if not direct:
+            # the reverse side of a many to many field of another model
+            field = field.field
+        if field.rel.through not in through_models:
+            through_models.append(field.rel.through)
+    return through_models
+
+
+class BaseReportCache(object):
+    """
+    Stores the encoded output of reports and the generation of the models
+    they're made of. Entries expire after `timeout` seconds, or never if
+    it's None
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+
+    def get_key(self, reporter, *extra):
+        """
+        Returns the key of the output of `reporter`, which must have a
+        queryset. Anything else the output depends on, like the writer or
+        the encoding, can be given in `extra`
+        """
+        reporter_class = type(reporter)
+        identity = [
+            '%s.%s' % (reporter_class.__module__, reporter_class.__name__),
+            list(reporter.visible_fields),
+            get_queryset_fingerprint(reporter.items),
+            self.get_generation(reporter._meta.model),
+            list(extra),
+        ]
+        return hashlib.sha1(json.dumps(identity, default=unicode)).hexdigest()
+
+    def get(self, key):
+        """
+        Returns a `(headers, fh)` tuple with the headers and a file object
+        with the content of the entry for `key`, or None if there isn't a
+        fresh one
+        """
+        raise NotImplementedError
+
+    def set(self, key, headers, content):
+        for _ in self.cache_chunks(key, headers, [content]):
+            pass
+
+    def cache_chunks(self, key, headers, chunks):
+        """
+        Yields the given chunks while storing them, so streamed content is
+        cached once it's sent. Entries are only stored if every chunk is
+        consumed
+        """
+        entry = self.open_entry(key)
+        try:
+            for chunk in chunks:
+                entry.write(chunk)
+                yield chunk
+        except:
+            entry.discard()
+            raise
+        entry.commit(headers)
+
+    def open_entry(self, key):
+        """
+        Returns an object with `write(data)`, `commit(headers)` and
+        `discard()` methods to store the entry for `key`
+        """
+        raise NotImplementedError
+
+    def get_generation(self, model):
+        raise NotImplementedError
+
+    def invalidate(self, model):
+        """
+        Changes the generation of `model`, so no cached report of it is
+        served anymore
+        """
+        raise NotImplementedError
+
+    def watch(self, model):
+        """
+        Invalidates the reports of `model` every time one of its instances
+        is saved or deleted
+        """
+        def receiver(sender, **kwargs):
+            self.invalidate(sender)
+
+        for signal in (post_save, post_delete):
+            signal.connect(receiver, sender=model, weak=False,
+                           dispatch_uid=self._get_dispatch_uid(model))
+
+    def unwatch(self, model):
+        for signal in (post_save, post_delete):
+            signal.disconnect(sender=model, dispatch_uid=self._get_dispatch_uid(model))
+
+    def watch_reporter(self, reporter_class):
+        """
+        Invalidates the reports of the model of `reporter_class` every time
+        one of its instances is saved or deleted, or the many to many
+        relations among its fields change. Processes changing them without
+        defining the views of the reports, like workers, need to call it
+        too, e.g. from a `models.py` module
+        """
+        model = reporter_class._meta.model
+        self.watch(model)
+
+        def receiver(sender, action, **kwargs):
+            if action in ('post_add', 'post_remove', 'post_clear'):
+                self.invalidate(model)
+
+        for through in get_through_models(reporter_class):
+            m2m_changed.connect(receiver, sender=through, weak=False,
+                                dispatch_uid=self._get_dispatch_uid(model, through))
+
+    def unwatch_reporter(self, reporter_class):
+        model = reporter_class._meta.model
+        self.unwatch(model)
+        for through in get_through_models(reporter_class):
+            m2m_changed.disconnect(sender=through,
+                                   dispatch_uid=self._get_dispatch_uid(model, through))
+
+    def _get_dispatch_uid(self, *models):
+        return 'reportato.cache.%s.%s' % (
+            id(self), '.'.join(_get_model_label(model) for model in models))
+
+
+class _FileEntry(object):
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        fd, self.tmp_path = tempfile.mkstemp(dir=cache.location, suffix='.tmp')
+        self.fh = os.fdopen(fd, 'wb')
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        self.fh.write(data)
+
+    def discard(self):
+        self.fh.close()
+        os.remove(self.tmp_path)
+
+    def commit(self, headers):
+        self.fh.close()
+        if self.cache.max_size is not None and self.size > self.cache.max_size:
+            os.remove(self.tmp_path)
+            return
+        # the metadata goes first, so there's never content without it
+        with open(self.tmp_path + '.meta', 'wb') as fh:
+            json.dump({'headers': headers, 'created': time.time()}, fh)
+        os.rename(self.tmp_path + '.meta', self.cache.meta_path(self.key))
+        os.rename(self.tmp_path, self.cache.path(self.key))
+        self.cache.cull()
+
+
+class FileSystemReportCache(BaseReportCache):
+    """
+    Stores reports as files in the `location` directory. Once they take
+    more than `max_size` bytes, the least recently used ones are deleted
+    """
+
+    def __init__(self, location, max_size=None, timeout=None):
+        super(FileSystemReportCache, self).__init__(timeout)
+        self.location = location
+        self.max_size = max_size
+
+    def path(self, key):
+        return os.path.join(self.location, key + '.report')
+
+    def meta_path(self, key):
+        return os.path.join(self.location, key + '.meta')
+
+    def generation_path(self, model):
+        return os.path.join(self.location, _get_model_label(model) + '.generation')
+
+    def get(self, key):
+        try:
+            with open(self.meta_path(key), 'rb') as fh:
+                meta = json.load(fh)
+            fh = open(self.path(key), 'rb')
+        except (IOError, ValueError):
+            return None
+
+        if self.timeout is not None and time.time() - meta['created'] >= self.timeout:
+            fh.close()
+            self.delete(key)
+            return None
+        # the modification time of the content is the time it was last used
+        try:
+            os.utime(self.path(key), None)
+        except OSError:
+            pass
+        return meta['headers'], fh
+
+    def open_entry(self, key):
+        self._ensure_location()
+        return _FileEntry(self, key)
+
+    def delete(self, key):
+        for path in (self.path(key), self.meta_path(key)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def cull(self):
+        """
+        Deletes the least recently used reports until they take at most
+        `max_size` bytes
+        """
+        if self.max_size is None:
+            return
+        entries = []
+        for name in os.listdir(self.location):
+            if not name.endswith('.report'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.location, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name[:-len('.report')]))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.max_size:
+                break
+            self.delete(key)
+            total -= size
+
+    def _ensure_location(self):
+        if not os.path.isdir(self.location):
+            os.makedirs(self.location)
+
+    def get_generation(self, model):
+        try:
+            with open(self.generation_path(model), 'rb') as fh:
+                return fh.read()
+        except IOError:
+            return ''
+
+    def invalidate(self, model):
+        self._ensure_location()
+        # a new random generation, so concurrent invalidations never clash
+        fd, tmp_path = tempfile.mkstemp(dir=self.location, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(uuid.uuid4().hex)
+        os.rename(tmp_path, self.generation_path(model))
+
+
+class _DjangoCacheEntry(object):
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        self.buffer = io.BytesIO()
+
+    def write(self, data):
+        if self.buffer is None:
+            return
+        self.buffer.write(data)
+        max_entry_size = self.cache.max_entry_size
+        if max_entry_size is not None and self.buffer.tell() > max_entry_size:
+            # too big to be cached, so stop buffering it
+            self.buffer = None
+
+    def discard(self):
+        self.buffer = None
+
+    def commit(self, headers):
+        if self.buffer is not None:
+            self.cache.cache.set(self.cache.make_key(self.key),
+                                 (headers, self.buffer.getvalue()),
+                                 self.cache.timeout)
+
+
+class DjangoReportCache(BaseReportCache):
+    """
+    Stores reports in the Django cache `cache_alias`, which takes care of
+    evicting them. Reports bigger than `max_entry_size` bytes aren't cached,
+    e.g. to keep them under the item size limit of memcached
+    """
+
+    def __init__(self, cache_alias='default', max_entry_size=None, timeout=None,
+                 key_prefix='reportato'):
+        super(DjangoReportCache, self).__init__(timeout)
+        self.cache = get_cache(cache_alias)
+        self.max_entry_size = max_entry_size
+        self.key_prefix = key_prefix
+
+    def make_key(self, key):
+        return '%s:report:%s' % (self.key_prefix, key)
+
+    def get(self, key):
+        entry = self.cache.get(self.make_key(key))
+        if entry is None:
+            return None
+        headers, content = entry
+        return headers, io.BytesIO(content)
+
+    def open_entry(self, key):
+        return _DjangoCacheEntry(self, key)
+
+    def _generation_key(self, model):
+        return '%s:generation:%s' % (self.key_prefix, _get_model_label(model))
+
+    def get_generation(self, model):
+        key = self._generation_key(model)
+        generation = self.cache.get(key)
+        if generation is None:
+            self.cache.add(key, uuid.uuid4().hex, None)
+            generation = self.cache.get(key)
+        return generation
+
+    def invalidate(self, model):
+        self.cache.set(self._generation_key(model), uuid.uuid4().hex, None)
@@ -0,0 +1,50 @@
+"""
+Decorators for the custom `get_FIELD_column` methods of reporters
+"""
+
+
+def column_type(type):
+    """
+    Declares the type of the values returned by a custom column, used by
+    typed exports like `reportato.columnar`. `type` is a pyarrow type or the
+    name of one, e.g. 'int64' or 'timestamp[us]'
+
+        @column_type('int64')
+        def get_age_column(self, instance):
+            return instance.get_age()
+    """
+    def decorator(func):
+        func.column_type = type
+        return func
+    return decorator
+
+
+def cached_column(key):
+    """
+    Lets reporters with a `render_cache_size` cache the values of a custom
+    column. `key` is a function returning a hashable value for an instance;
+    instances with the same key are rendered only once
+
+        @cached_column(lambda instance: instance.company_id)
+        def get_company_column(self, instance):
+            return instance.company.get_display_name()
+    """
+    def decorator(func):
+        func.cache_key = key
+        return func
+    return decorator
+
+
+def requires(*fields):
+    """
+    Declares the model fields read by a custom column, so reporters can
+    fetch only the fields they need
+
+        @requires('first_name', 'last_name')
+        def get_full_name_column(self, instance):
+            return instance.get_full_name()
+    """
+    def decorator(func):
+        func.required_fields = fields
+        return func
+    return decorator
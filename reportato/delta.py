@@ -0,0 +1,74 @@
+"""
+Incremental reports, rendering only the rows changed since a previous export
+according to the reporter's `Meta.change_tracking_field`.
+
+    >>> reporter = MyReporter()
+    >>> with open('delta.csv', 'wb') as fh:
+    ...     watermark = write_delta(reporter, fh, since=previous_watermark)
+    >>> with open('full.csv', 'rb') as previous, open('new.csv', 'wb') as fh:
+    ...     watermark = merge_delta(reporter, previous, fh, since=previous_watermark)
+
+Both return the watermark to store and use for the next export.
+"""
+import csv
+from collections import OrderedDict
+
+from .utils import UnicodeWriter, close_writer
+
+
+def write_delta(reporter, fh, since=None, writer_class=UnicodeWriter,
+                write_header=True):
+    """
+    Writes the rows changed after the `since` watermark into `fh`, and
+    returns the new watermark
+    """
+    watermark = reporter.get_watermark()
+    changed = reporter.changed_since(since)
+
+    writer = writer_class(fh)
+    if write_header:
+        writer.writerow(changed.get_header_row())
+    writer.writerows(changed.get_rows())
+    close_writer(writer)
+
+    return watermark if watermark is not None else since
+
+
+def merge_delta(reporter, previous, fh, since=None, writer_class=UnicodeWriter,
+                write_header=True, encoding='utf-8'):
+    """
+    Writes into `fh` the `previous` export (a file with the same columns and
+    `encoding`) with the rows changed after the `since` watermark rewritten,
+    and the new ones appended at the end. Returns the new watermark.
+
+    Rows are matched using the reporter's `Meta.key_field`, which needs to
+    be visible. Rows deleted since the previous export are kept.
+    """
+    key_field = reporter._meta.key_field or reporter._meta.model._meta.pk.name
+    key_index = list(reporter.visible_fields).index(key_field)
+
+    watermark = reporter.get_watermark()
+    changed = reporter.changed_since(since)
+    # only the changed rows are kept in memory
+    changed_rows = OrderedDict((row[key_index], row) for row in changed.get_rows())
+
+    reader = csv.reader(previous)
+    writer = writer_class(fh)
+    if write_header:
+        header = next(reader, None)
+        if header is not None:
+            writer.writerow([cell.decode(encoding) for cell in header])
+        else:
+            writer.writerow(changed.get_header_row())
+
+    for row in reader:
+        row = [cell.decode(encoding) for cell in row]
+        key = row[key_index]
+        if key in changed_rows:
+            row = changed_rows.pop(key)
+        writer.writerow(row)
+
+    writer.writerows(changed_rows.values())
+    close_writer(writer)
+
+    return watermark if watermark is not None else since
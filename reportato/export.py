@@ -0,0 +1,206 @@
+"""
+Exports reports into local files, e.g. from a nightly cron job. Reports are
+written into a temporary file next to the final one, which is synced to disk
+and renamed into place once it's complete, so a crashed export never leaves
+a truncated report behind:
+
+    >>> export_to_file(MyReporter(), '/var/reports/my-report.csv', keep=7)
+    {'file': 'my-report.csv', 'rows': 1000, 'bytes': 53101, 'sha256': '...', ...}
+
+The previous versions of the file are kept as `my-report.csv.1` (the most
+recent one), `my-report.csv.2` and so on, and every version has a manifest
+next to it, like `my-report.csv.manifest.json`, with its number of rows,
+size, SHA-256 checksum and the time it took.
+"""
+import hashlib, io, json, os, tempfile, time
+from multiprocessing.pool import ThreadPool
+
+from django.db import connections
+
+from .utils import BufferedUnicodeWriter, close_writer, get_file_mode
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+
+class _ChecksumStream(object):
+    """
+    File-like object counting and hashing the bytes written to "fh"
+    """
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.size = 0
+        self.checksum = hashlib.sha256()
+
+    def write(self, data):
+        self.size += len(data)
+        self.checksum.update(data)
+        self.fh.write(data)
+
+
+def get_manifest_path(path):
+    return path + '.manifest.json'
+
+
+def get_version_path(path, version):
+    """
+    Returns the path of a previous version of the file in `path`, 1 being
+    the most recent one
+    """
+    return '%s.%d' % (path, version)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _sync_directory(directory):
+    """
+    Makes renames in `directory` durable, where the platform allows it
+    """
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:  # pragma: no cover
+        return
+    try:
+        os.fsync(fd)
+    except OSError:  # pragma: no cover
+        pass
+    finally:
+        os.close(fd)
+
+
+def _write_synced(path, write, buffer_size=DEFAULT_BUFFER_SIZE):
+    """
+    Calls `write` with a file object to write the content of `path` into,
+    which is a temporary file next to it until it's renamed into place, with
+    the permissions of the current file, if any. Returns the path of the temporary file, synced to disk, and the result
+    of `write`
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.%s.' % name, suffix='.tmp')
+    try:
+        os.fchmod(fd, get_file_mode(path))
+        with io.open(fd, 'wb', buffering=buffer_size) as fh:
+            result = write(fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+    except:
+        _remove(tmp_path)
+        raise
+    return tmp_path, result
+
+
+def rotate_versions(path, keep):
+    """
+    Turns the current file in `path` and its manifest into their most recent
+    previous version, keeping up to `keep` versions of the file counting the
+    current one. The current file stays in place until it's replaced
+    """
+    if keep <= 1:
+        return
+
+    for base in (path, get_manifest_path(path)):
+        _remove(get_version_path(base, keep - 1))
+
+    for version in xrange(keep - 2, 0, -1):
+        for base in (path, get_manifest_path(path)):
+            older = get_version_path(base, version)
+            if os.path.exists(older):
+                os.rename(older, get_version_path(base, version + 1))
+
+    for base in (path, get_manifest_path(path)):
+        if os.path.exists(base):
+            # a hard link, so there's no moment without a current file
+            os.link(base, get_version_path(base, 1))
+
+
+def export_to_file(reporter, path, keep=1, buffer_size=DEFAULT_BUFFER_SIZE,
+                   writer_class=BufferedUnicodeWriter, write_header=True):
+    """
+    Writes the report of `reporter` into the file in `path` through a write
+    buffer of `buffer_size` bytes, replacing it atomically once it's
+    complete, and writes its manifest. Up to `keep` versions of the file are
+    kept, counting the new one. Returns the manifest
+    """
+    started = time.time()
+    rows = [0]
+
+    def count_rows(report_rows):
+        for row in report_rows:
+            rows[0] += 1
+            yield row
+
+    def write(fh):
+        stream = _ChecksumStream(fh)
+        writer = writer_class(stream)
+        if write_header:
+            writer.writerow(reporter.get_header_row())
+        writer.writerows(count_rows(reporter.get_rows()))
+        close_writer(writer)
+        return stream
+
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    tmp_path, stream = _write_synced(path, write, buffer_size)
+    reporter_class = type(reporter)
+    manifest = {
+        'file': os.path.basename(path),
+        'reporter': '%s.%s' % (reporter_class.__module__, reporter_class.__name__),
+        'rows': rows[0],
+        'bytes': stream.size,
+        'sha256': stream.checksum.hexdigest(),
+        'duration': time.time() - started,
+        'created': started,
+    }
+    manifest_path = get_manifest_path(path)
+    try:
+        tmp_manifest_path, _ = _write_synced(
+            manifest_path,
+            lambda fh: fh.write(json.dumps(manifest, indent=2, sort_keys=True)))
+        try:
+            rotate_versions(path, keep)
+        except:
+            _remove(tmp_manifest_path)
+            raise
+    except:
+        _remove(tmp_path)
+        raise
+    # the report only replaces the current one once it's complete
+    os.rename(tmp_path, path)
+    os.rename(tmp_manifest_path, manifest_path)
+    _sync_directory(directory)
+    return manifest
+
+
+def _export(args):
+    reporter, path, kwargs = args
+    try:
+        return export_to_file(reporter, path, **kwargs)
+    finally:
+        # every thread gets its own database connections
+        for connection in connections.all():
+            connection.close()
+
+
+def export_many(exports, workers=4, **kwargs):
+    """
+    Runs `export_to_file` for every `(reporter, path)` tuple in `exports`,
+    up to `workers` at a time in a pool of threads. Any other argument is
+    passed to `export_to_file`. Returns the manifests, in the same order.
+    With a single worker, reports are exported in the current thread
+    """
+    if workers <= 1 or len(exports) <= 1:
+        return [export_to_file(reporter, path, **kwargs) for reporter, path in exports]
+
+    pool = ThreadPool(processes=min(workers, len(exports)))
+    try:
+        return pool.map(_export, [(reporter, path, kwargs) for reporter, path in exports])
+    finally:
+        pool.close()
+        pool.join()
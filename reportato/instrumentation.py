@@ -0,0 +1,300 @@
+"""
+Instrumentation of reports. A `ReportInstrument` set on a reporter (or on a
+view, using `instrument_class`) measures where the time of a report goes:
+
+    >>> reporter = MyReporter()
+    >>> reporter.instrument = ReportInstrument(callbacks=[log_metrics])
+    >>> rows = list(reporter.get_rows())  # metrics are logged once it's done
+
+Once the report is finished, the metrics are passed to every callback and
+sent with the `reportato.signals.report_finished` signal. Reporters and views
+without an instrument don't pay any overhead.
+"""
+import logging
+from itertools import count
+from timeit import default_timer as timer
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .signals import report_finished
+
+logger = logging.getLogger('reportato')
+
+
+class ReportMetrics(object):
+    """
+    Metrics of a single report. Times are in seconds.
+
+    `render_time` is the time spent fetching and rendering rows, database
+    queries included, and `encode_time` the time spent by the writer. Column
+    times are the total time and number of timed calls per column renderer.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.bytes = 0
+        self.queries = 0
+        self.query_time = 0.0
+        self.render_time = 0.0
+        self.encode_time = 0.0
+        self.column_times = {}
+        self.time_to_first_byte = None
+        self.total_time = None
+
+    def get_slowest_columns(self, limit=None):
+        """
+        Returns a list of `(column, average seconds per call)` tuples, with
+        the slowest columns first
+        """
+        averages = [(name, seconds / calls)
+                    for name, (seconds, calls) in self.column_times.iteritems()
+                    if calls]
+        averages.sort(key=lambda average: average[1], reverse=True)
+        return averages[:limit]
+
+    def as_dict(self, slowest_columns=None):
+        return {
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'queries': self.queries,
+            'query_time': self.query_time,
+            'render_time': self.render_time,
+            'encode_time': self.encode_time,
+            'time_to_first_byte': self.time_to_first_byte,
+            'total_time': self.total_time,
+            'slowest_columns': self.get_slowest_columns(slowest_columns),
+        }
+
+
+class _TimedWriter(object):
+    """
+    Proxy measuring the time spent by a writer. Rows passed to `writerows`
+    are usually rendered while they're written, so the time spent rendering
+    them is discounted
+    """
+
+    def __init__(self, writer, metrics):
+        self.writer = writer
+        self.metrics = metrics
+
+    def _call(self, method, *args):
+        metrics = self.metrics
+        render_time = metrics.render_time
+        start = timer()
+        result = method(*args)
+        metrics.encode_time += timer() - start - (metrics.render_time - render_time)
+        return result
+
+    def writerow(self, row):
+        return self._call(self.writer.writerow, row)
+
+    def writerows(self, rows):
+        return self._call(self.writer.writerows, rows)
+
+    def close(self):
+        close = getattr(self.writer, 'close', None)
+        if close is not None:
+            return self._call(close)
+
+    def __getattr__(self, name):
+        return getattr(self.writer, name)
+
+
+class _CountingStream(object):
+    """
+    File-like object counting the bytes written to "fh"
+    """
+
+    def __init__(self, fh, metrics):
+        self.fh = fh
+        self.metrics = metrics
+
+    def write(self, data):
+        self.metrics.bytes += len(data)
+        self.fh.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.fh, name)
+
+
+class _TrackedChunks(object):
+
+    def __init__(self, instrument, chunks):
+        self.instrument = instrument
+        self.chunks = chunks
+
+    def __iter__(self):
+        instrument = self.instrument
+        try:
+            for chunk in self.chunks:
+                instrument.mark_first_byte()
+                instrument.metrics.bytes += len(chunk)
+                yield chunk
+        except:
+            # failed or interrupted reports don't send their metrics
+            instrument.stop()
+            raise
+        instrument.finish()
+
+    def close(self):
+        self.instrument.stop()
+
+
+class ReportInstrument(object):
+    """
+    Collects the metrics of a report: rows, bytes, database queries and
+    their time, time per column renderer, encode time and time to first
+    byte.
+
+    Timing every cell has a cost, so with `sample_every` only one out of
+    that many calls of every column renderer is timed. `slowest_columns` is
+    the number of columns listed in the `as_dict()` of the metrics.
+
+    `callbacks` are called with the instrument and the `ReportMetrics` once
+    the report is finished.
+
+    Queries are counted using the debug cursor of the connection, so every
+    query of the report is kept in `connection.queries` until it's finished.
+    """
+
+    def __init__(self, callbacks=(), sample_every=1, slowest_columns=5):
+        self.callbacks = list(callbacks)
+        self.sample_every = sample_every
+        self.slowest_columns = slowest_columns
+        self.metrics = None
+        self.reporter = None
+        self.started = None
+        self._connection = None
+
+    def start(self, reporter=None, using=DEFAULT_DB_ALIAS):
+        """
+        Starts measuring a new report, capturing the queries of the `using`
+        database connection
+        """
+        self.metrics = ReportMetrics()
+        self.reporter = reporter
+        self._connection = connections[using]
+        self._use_debug_cursor = self._connection.use_debug_cursor
+        # the debug cursor keeps track of the queries and their time
+        self._connection.use_debug_cursor = True
+        self._first_query = len(self._connection.queries)
+        self.started = timer()
+
+    def finish(self):
+        """
+        Stops measuring the report and sends its metrics. Does nothing if
+        it isn't being measured
+        """
+        if self.started is None:
+            return
+        metrics = self.metrics
+        metrics.total_time = timer() - self.started
+
+        queries = self._connection.queries[self._first_query:]
+        metrics.queries = len(queries)
+        metrics.query_time = sum(float(query['time']) for query in queries)
+        self.stop()
+
+        for callback in self.callbacks:
+            callback(self, metrics)
+        report_finished.send(sender=type(self.reporter) if self.reporter else None,
+                             reporter=self.reporter, metrics=metrics)
+
+    def stop(self):
+        """
+        Stops measuring the report without sending its metrics, e.g. when it
+        fails, restoring the debug cursor setting of the connection
+        """
+        if self.started is None:
+            return
+        self.started = None
+        self._connection.use_debug_cursor = self._use_debug_cursor
+
+    def mark_first_byte(self):
+        if self.metrics.time_to_first_byte is None:
+            self.metrics.time_to_first_byte = timer() - self.started
+
+    def track_rows(self, rows, reporter):
+        """
+        Counts the rows of `reporter` and the time spent producing them.
+        Reports used on their own are started and finished here
+        """
+        owner = self.started is None
+        if owner:
+            items = reporter.items
+            self.start(reporter, getattr(items, 'db', DEFAULT_DB_ALIAS))
+        elif self.reporter is None:
+            self.reporter = reporter
+
+        metrics = self.metrics
+        rows = iter(rows)
+        try:
+            while True:
+                start = timer()
+                try:
+                    row = next(rows)
+                except StopIteration:
+                    return
+                finally:
+                    metrics.render_time += timer() - start
+                metrics.rows += 1
+                yield row
+        finally:
+            if owner:
+                self.finish()
+
+    def wrap_renderers(self, names, renderers):
+        """
+        Returns the given column renderers measuring their time
+        """
+        return tuple(self._timed_renderer(name, render)
+                     for name, render in zip(names, renderers))
+
+    def _timed_renderer(self, name, render):
+        timings = self.metrics.column_times.setdefault(name, [0.0, 0])
+        every = self.sample_every
+        calls = count()
+
+        def timed(instance):
+            if every > 1 and next(calls) % every:
+                return render(instance)
+            start = timer()
+            try:
+                return render(instance)
+            finally:
+                timings[0] += timer() - start
+                timings[1] += 1
+
+        return timed
+
+    def wrap_writer(self, writer):
+        """
+        Returns a proxy of `writer` measuring the time spent encoding rows
+        """
+        return _TimedWriter(writer, self.metrics)
+
+    def wrap_stream(self, fh):
+        """
+        Returns a proxy of the file-like object `fh` counting the bytes
+        written to it
+        """
+        return _CountingStream(fh, self.metrics)
+
+    def track_chunks(self, chunks):
+        """
+        Counts the bytes of a streamed report, and finishes it once the last
+        chunk is sent. The report is stopped if the stream fails, or if the
+        returned iterable is closed before it's finished, e.g. if the
+        response is never sent
+        """
+        return _TrackedChunks(self, chunks)
+
+
+def log_metrics(instrument, metrics):
+    """
+    Callback logging the metrics of a report to the 'reportato' logger
+    """
+    reporter = instrument.reporter
+    logger.info('Report %s finished: %s',
+                type(reporter).__name__ if reporter else '-',
+                metrics.as_dict(instrument.slowest_columns))
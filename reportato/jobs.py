@@ -0,0 +1,376 @@
+"""
+Background generation of reports. Generated files are stored under a key
+built from the reporter class, the queryset filters and the visible fields,
+and served from the storage until they are stale or invalidated.
+
+    >>> jobs = ReportJobManager(ThreadPoolJobBackend(workers=2),
+    ...                         FileSystemReportStorage('/var/reports'),
+    ...                         max_age=60 * 60)
+    >>> jobs.request(MyReporter, {'active': True})
+    'pending'
+    >>> jobs.request(MyReporter, {'active': True})  # once it's finished
+    'ready'
+
+Alongside every report, an index records the byte offset where every
+`index_interval` rows start, so ranges of rows can be read without going
+through the whole file.
+"""
+import csv, hashlib, json, logging, os, tempfile, time
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+
+from django.db import connection
+
+from .utils import UnicodeWriter, batched, close_writer, get_file_mode
+
+logger = logging.getLogger('reportato')
+
+PENDING = 'pending'
+READY = 'ready'
+
+
+def get_report_key(reporter_class, filters=None, visible_fields=None):
+    """
+    Returns a key identifying the report generated by `reporter_class` for
+    the given filters and visible fields
+    """
+    identity = [
+        '%s.%s' % (reporter_class.__module__, reporter_class.__name__),
+        sorted((filters or {}).items()),
+        list(visible_fields or reporter_class.fields),
+    ]
+    return hashlib.sha1(json.dumps(identity, default=unicode)).hexdigest()
+
+
+class BaseReportStorage(object):
+    """
+    Storage for generated report files
+    """
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def get_modified_time(self, key):
+        """
+        Returns the timestamp of the last time the file for `key` was saved
+        """
+        raise NotImplementedError
+
+    def open(self, key):
+        raise NotImplementedError
+
+    def save(self, key, write):
+        """
+        Calls `write` with a file object to write the report into. Files
+        must not be visible until `write` finishes
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def get_size(self, key):
+        raise NotImplementedError
+
+    def get_etag(self, key):
+        """
+        Returns a quoted entity tag identifying the current file for `key`,
+        which changes every time it's saved
+        """
+        return self.make_etag(key, self.get_modified_time(key), self.get_size(key))
+
+    def make_etag(self, key, modified_time, size):
+        return '"%s-%x-%x"' % (key[:12], int(modified_time * 1000), size)
+
+    def save_index(self, key, index):
+        """
+        Stores the row index of the report for `key`. Storages not
+        implementing it just don't support ranges of rows
+        """
+
+    def get_index(self, key):
+        return None
+
+
+class FileSystemReportStorage(BaseReportStorage):
+
+    def __init__(self, location, suffix='.csv'):
+        self.location = location
+        self.suffix = suffix
+
+    def path(self, key):
+        return os.path.join(self.location, key + self.suffix)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def get_modified_time(self, key):
+        return os.path.getmtime(self.path(key))
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def get_size(self, key):
+        return os.path.getsize(self.path(key))
+
+    def index_path(self, key):
+        return self.path(key) + '.index'
+
+    def _save_file(self, path, write):
+        if not os.path.isdir(self.location):
+            os.makedirs(self.location)
+
+        # write into a temporary file, so incomplete reports are never served
+        fd, tmp_path = tempfile.mkstemp(dir=self.location, suffix='.tmp')
+        try:
+            os.fchmod(fd, get_file_mode(path))
+            with os.fdopen(fd, 'wb') as fh:
+                write(fh)
+            os.rename(tmp_path, path)
+        except:
+            os.remove(tmp_path)
+            raise
+
+    def save(self, key, write):
+        self._save_file(self.path(key), write)
+
+    def save_index(self, key, index):
+        self._save_file(self.index_path(key), lambda fh: json.dump(index, fh))
+
+    def get_index(self, key):
+        try:
+            with open(self.index_path(key), 'rb') as fh:
+                return json.load(fh)
+        except (IOError, ValueError):
+            return None
+
+    def delete(self, key):
+        for path in (self.path(key), self.index_path(key)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class BaseJobBackend(object):
+    """
+    Runs the report generation jobs. Only one job per key should be running
+    at any time
+    """
+
+    def submit(self, key, func, *args):
+        raise NotImplementedError
+
+    def is_pending(self, key):
+        raise NotImplementedError
+
+
+class SynchronousJobBackend(BaseJobBackend):
+    """
+    Runs jobs straight away in the current thread. Useful for tests and
+    management commands
+    """
+
+    def submit(self, key, func, *args):
+        func(*args)
+
+    def is_pending(self, key):
+        return False
+
+
+class ThreadPoolJobBackend(BaseJobBackend):
+    """
+    Runs jobs in a pool of `workers` threads of the current process
+    """
+
+    def __init__(self, workers=1):
+        self.pool = ThreadPool(processes=workers)
+        self.pending = {}
+        self.lock = Lock()
+
+    def _run(self, key, func, args):
+        try:
+            func(*args)
+        except Exception:
+            logger.exception('Error generating report %s', key)
+        finally:
+            # every thread gets its own database connection
+            connection.close()
+            with self.lock:
+                del self.pending[key]
+
+    def submit(self, key, func, *args):
+        with self.lock:
+            if key in self.pending:
+                return self.pending[key]
+            result = self.pending[key] = self.pool.apply_async(
+                self._run, (key, func, args))
+        return result
+
+    def is_pending(self, key):
+        with self.lock:
+            return key in self.pending
+
+
+class ReportJobManager(object):
+    """
+    Generates reports in the background using `backend`, storing them in
+    `storage`. Stored reports older than `max_age` seconds are generated again.
+
+    The offset of every `index_interval` rows is stored in the index of the
+    report, or not at all if it's None. Offsets are only meaningful for CSV
+    writers with an ASCII compatible encoding.
+    """
+
+    def __init__(self, backend, storage, max_age=None,
+                 writer_class=UnicodeWriter, write_header=True,
+                 index_interval=1000):
+        self.backend = backend
+        self.storage = storage
+        self.max_age = max_age
+        self.writer_class = writer_class
+        self.write_header = write_header
+        self.index_interval = index_interval
+
+    def is_fresh(self, key):
+        if not self.storage.exists(key):
+            return False
+        if self.max_age is None:
+            return True
+        return time.time() - self.storage.get_modified_time(key) < self.max_age
+
+    def request(self, reporter_class, filters=None, visible_fields=None):
+        """
+        Returns `READY` if there's a fresh report for the given arguments.
+        Otherwise enqueues its generation, if it isn't already, and returns
+        `PENDING`
+        """
+        key = get_report_key(reporter_class, filters, visible_fields)
+        if self.is_fresh(key):
+            return READY
+
+        if not self.backend.is_pending(key):
+            self.backend.submit(key, self.generate, key, reporter_class,
+                                filters, visible_fields)
+
+        return READY if self.is_fresh(key) else PENDING
+
+    def open(self, reporter_class, filters=None, visible_fields=None):
+        return self.storage.open(
+            get_report_key(reporter_class, filters, visible_fields))
+
+    def invalidate(self, reporter_class, filters=None, visible_fields=None):
+        self.storage.delete(
+            get_report_key(reporter_class, filters, visible_fields))
+
+    def get_size(self, reporter_class, filters=None, visible_fields=None):
+        return self.storage.get_size(
+            get_report_key(reporter_class, filters, visible_fields))
+
+    def get_etag(self, reporter_class, filters=None, visible_fields=None):
+        return self.storage.get_etag(
+            get_report_key(reporter_class, filters, visible_fields))
+
+    def open_report(self, reporter_class, filters=None, visible_fields=None):
+        """
+        Returns a `(fh, size, etag)` tuple with the stored report opened, and
+        the size and entity tag of that same file, so they stay consistent
+        even if the report is generated again in the meantime
+        """
+        key = get_report_key(reporter_class, filters, visible_fields)
+        fh = self.storage.open(key)
+        try:
+            stat = os.fstat(fh.fileno())
+        except (AttributeError, IOError, OSError):
+            # not a real file
+            return fh, self.storage.get_size(key), self.storage.get_etag(key)
+        return fh, stat.st_size, self.storage.make_etag(key, stat.st_mtime, stat.st_size)
+
+    def get_index(self, reporter_class, filters=None, visible_fields=None, size=None):
+        """
+        Returns the row index of the stored report, or None if there isn't
+        one matching the current file, or the file of `size` bytes
+        """
+        key = get_report_key(reporter_class, filters, visible_fields)
+        index = self.storage.get_index(key)
+        if size is None:
+            size = self.storage.get_size(key)
+        # the index is saved after the report, so it may be a stale one
+        if index is None or index['size'] != size:
+            return None
+        return index
+
+    def generate(self, key, reporter_class, filters=None, visible_fields=None):
+        queryset = reporter_class._meta.model._default_manager.filter(**(filters or {}))
+        reporter = reporter_class(queryset, visible_fields)
+        index = {'interval': self.index_interval, 'rows': 0, 'offsets': []}
+
+        def write(fh):
+            writer = self.writer_class(fh)
+            if self.write_header:
+                writer.writerow(reporter.get_header_row())
+
+            if self.index_interval is None:
+                writer.writerows(reporter.get_rows())
+            else:
+                for rows in batched(reporter.get_rows(), self.index_interval):
+                    # the offset is only known once buffered rows are written
+                    _flush_writer(writer, fh)
+                    index['offsets'].append(fh.tell())
+                    index['rows'] += len(rows)
+                    writer.writerows(rows)
+
+            close_writer(writer)
+            index['size'] = fh.tell()
+
+        self.storage.save(key, write)
+        if self.index_interval is not None:
+            self.storage.save_index(key, index)
+
+
+def _flush_writer(writer, fh):
+    flush = getattr(writer, 'flush', None)
+    if flush is not None:
+        flush()
+    fh.flush()
+
+
+def _skip_rows(fh, offset, count):
+    """
+    Returns the offset of the CSV record `count` records after the one
+    starting at `offset`
+    """
+    fh.seek(offset)
+    position = [offset]
+
+    def lines():
+        while True:
+            line = fh.readline()
+            if not line:
+                return
+            position[0] += len(line)
+            yield line
+
+    # the reader doesn't read ahead, so the position is always the end of
+    # the last record read
+    reader = csv.reader(lines())
+    for _ in xrange(count):
+        next(reader)
+    return position[0]
+
+
+def get_row_range(fh, index, first, last):
+    """
+    Returns the byte offsets where the rows `first` to `last` (both included,
+    starting from 0) of the indexed report file `fh` start and end. Rows out
+    of range are ignored, and ValueError is raised if there isn't any row
+    in the range
+    """
+    last = min(last, index['rows'] - 1)
+    if first < 0 or first > last:
+        raise ValueError('No rows in the range %s-%s' % (first, last))
+
+    interval, offsets = index['interval'], index['offsets']
+    start = _skip_rows(fh, offsets[first // interval], first % interval)
+    end = _skip_rows(fh, offsets[last // interval], last % interval + 1)
+    return start, end
@@ -0,0 +1,46 @@
+from optparse import make_option
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_by_path
+
+from reportato.export import DEFAULT_BUFFER_SIZE, export_many
+
+
+class Command(BaseCommand):
+    args = '<reporter path> [<reporter path> ...]'
+    help = ('Exports every reporter, given by its dotted path, into the file '
+            'after it, replacing the file atomically once it is complete.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--keep', action='store', type='int', dest='keep', default=1,
+            help='Number of versions of every file to keep, counting the new one.'),
+        make_option('--workers', action='store', type='int', dest='workers', default=4,
+            help='Number of reports exported at the same time.'),
+        make_option('--buffer-size', action='store', type='int', dest='buffer_size',
+            default=DEFAULT_BUFFER_SIZE, help='Size of the write buffer, in bytes.'),
+        make_option('--fields', action='store', dest='fields', default=None,
+            help='Comma separated list of the visible fields of every report.'),
+    )
+
+    def handle(self, *args, **options):
+        if not args or len(args) % 2:
+            raise CommandError('Expected pairs of reporter and file paths.')
+
+        visible_fields = options['fields'].split(',') if options['fields'] else None
+        exports = []
+        for reporter_path, path in zip(args[::2], args[1::2]):
+            try:
+                reporter_class = import_by_path(reporter_path)
+            except ImproperlyConfigured as error:
+                raise CommandError(error)
+            exports.append((reporter_class(visible_fields=visible_fields), path))
+
+        manifests = export_many(exports, workers=options['workers'],
+                                keep=options['keep'],
+                                buffer_size=options['buffer_size'])
+
+        for manifest, (_, path) in zip(manifests, exports):
+            self.stdout.write('%s: %d rows, %d bytes in %.2fs (sha256 %s)' % (
+                path, manifest['rows'], manifest['bytes'], manifest['duration'],
+                manifest['sha256']))
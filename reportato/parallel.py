@@ -0,0 +1,123 @@
+"""
+Exports a report rendering shards of its queryset in a pool of worker
+processes, which is useful when rendering the rows is CPU bound.
+
+    >>> with open('report.csv', 'wb') as fh:
+    ...     export_parallel(MyReporter(MyModel.objects.filter(...)), fh,
+    ...                     workers=4, shard_size=20000)
+"""
+import io
+from itertools import imap
+from multiprocessing import Pool
+
+from django.db import connections
+from django.db.models import Max, Min
+
+from .utils import UnicodeWriter, close_writer
+
+
+def _is_in_memory_database(connection):
+    return connection.vendor == 'sqlite' and \
+        connection.settings_dict['NAME'] in ('', ':memory:')
+
+
+def _close_connections():
+    """
+    Closes the database connections before forking the workers, so they
+    don't inherit the sockets in use by the current process. In-memory
+    SQLite databases only exist in the memory of the forked process, so
+    their connections are kept
+    """
+    for connection in connections.all():
+        if not _is_in_memory_database(connection):
+            connection.close()
+
+
+def _drop_connections():
+    """
+    Pool initializer, so every worker opens its own database connections.
+    Inherited connections are dropped rather than closed, as closing them
+    would end the session of the parent process on most databases
+    """
+    for connection in connections.all():
+        if not _is_in_memory_database(connection):
+            connection.connection = None
+
+
+def _render_shard(args):
+    """
+    Renders the rows of the items with a primary key in [lower, upper)
+    and returns them encoded by `writer_class`
+    """
+    reporter_class, query, visible_fields, writer_class, lower, upper = args
+
+    queryset = reporter_class._meta.model._default_manager.all()
+    queryset.query = query
+    queryset = queryset.filter(pk__gte=lower, pk__lt=upper).order_by('pk')
+    reporter = reporter_class(queryset, visible_fields)
+
+    fh = io.BytesIO()
+    writer = writer_class(fh)
+    writer.writerows(reporter.get_rows())
+    close_writer(writer)
+    return fh.getvalue()
+
+
+def get_shards(queryset, shard_size):
+    """
+    Splits the integer primary keys of `queryset` into [lower, upper) ranges
+    of `shard_size` values
+    """
+    bounds = queryset.aggregate(lower=Min('pk'), upper=Max('pk'))
+    if bounds['lower'] is None:
+        return []
+
+    return [(lower, min(lower + shard_size, bounds['upper'] + 1))
+            for lower in xrange(bounds['lower'], bounds['upper'] + 1, shard_size)]
+
+
+def export_parallel(reporter, fh, workers=None, shard_size=10000,
+                    writer_class=UnicodeWriter, write_header=True):
+    """
+    Writes the report into `fh`, rendering shards of `shard_size` primary
+    keys in `workers` processes (one per CPU by default) with their own
+    database connections. The output of every shard is written in order, so
+    the rows are sorted by primary key.
+
+    `reporter.items` must be an unsliced queryset with an integer primary key.
+    Workers build their own instance of the reporter class with the same
+    queryset and visible fields, so attributes set on `reporter` itself
+    are not used. `writer_class` needs to produce output that can be
+    concatenated, e.g. UTF-8.
+    """
+    queryset = reporter.items
+    if not getattr(queryset, 'query', None) or not queryset.query.can_filter():
+        raise ValueError('Parallel exports need an unsliced queryset')
+
+    if write_header:
+        writer = writer_class(fh)
+        writer.writerow(reporter.get_header_row())
+        close_writer(writer)
+
+    shards = [
+        (type(reporter), queryset.query, reporter.visible_fields, writer_class,
+         lower, upper)
+        for lower, upper in get_shards(queryset, shard_size)
+    ]
+
+    if workers == 1 or len(shards) <= 1:
+        for data in imap(_render_shard, shards):
+            fh.write(data)
+        return
+
+    _close_connections()
+    pool = Pool(processes=workers, initializer=_drop_connections)
+    try:
+        for data in pool.imap(_render_shard, shards):
+            fh.write(data)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
@@ -1,14 +1,336 @@
-from django.core.exceptions import FieldError
-from django.db.models import Manager
+import uuid, warnings
+from collections import namedtuple
+from functools import partial
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.exceptions import FieldError, ImproperlyConfigured
+from django.db import connections, transaction
+from django.db.models import Manager, Max, OneToOneField, Q
 from django.db.models.fields import FieldDoesNotExist
+from django.db.models.query import QuerySet
 from django.utils.datastructures import SortedDict
 
+from .utils import LRUCache, batched
+
 # This pattern with options and metaclasses is very similar to Django's
 # ModelForms. The idea is to keep a very similar API
 
+# Kinds of fields, as resolved by the reporter metaclass
+PLAIN_FIELD = 'plain'
+FOREIGN_KEY = 'fk'
+REVERSE_FOREIGN_KEY = 'reverse_fk'
+MANY_TO_MANY = 'm2m'
+ANNOTATION = 'annotation'
+
+
+# Header rows cached per reporter class, one for every set of visible fields
+HEADER_ROWS_CACHE_SIZE = 256
+
+# Precomputed description of every field of a reporter class. `kind` is None
+# for fields that aren't model fields or annotations. `renderer_name` and
+# `batch_renderer_name` are the names of the `get_FIELD_column` and
+# `get_FIELD_column_batch` methods a reporter may define for the field
+FieldDescriptor = namedtuple('FieldDescriptor', [
+    'name', 'header', 'kind', 'renderer_name', 'batch_renderer_name'])
+
+
 class UndefinedField(Exception):
     pass
 
+
+class DeferredFieldWarning(RuntimeWarning):
+    pass
+
+
+def _render_value(value):
+    """
+    Converts a single value into its unicode representation
+    """
+    if value is None:
+        return u''
+    return unicode(value)
+
+
+def _attribute_renderer(name):
+    """
+    Builds a renderer for model fields and plain attributes
+    """
+    getter = attrgetter(name)
+
+    def render(instance):
+        value = getter(instance)
+        if value is None:
+            return u''
+        return unicode(value)
+
+    return render
+
+
+def _manager_renderer(name):
+    """
+    Builds a renderer for reverse foreign keys and many to many fields
+    """
+    getter = attrgetter(name)
+
+    def render(instance):
+        return u', '.join(map(unicode, getter(instance).all()))
+
+    return render
+
+
+def _value_getter(name, kind):
+    """
+    Builds a function returning the raw value of a field, passed to
+    `get_FIELD_column_batch` methods. Related managers return a list with
+    the related objects
+    """
+    getter = attrgetter(name)
+    if kind not in (REVERSE_FOREIGN_KEY, MANY_TO_MANY):
+        return getter
+    return lambda instance: list(getter(instance).all())
+
+
+def _single_value_renderer(getter, render_batch):
+    """
+    Renders a single value with a `get_FIELD_column_batch` method
+    """
+    return lambda instance: render_batch([getter(instance)])[0]
+
+
+def _cached_related_renderer(name, cache):
+    """
+    Builds a renderer for foreign keys, caching the rendered related objects
+    by model and primary key
+    """
+    getter = attrgetter(name)
+
+    def render(instance):
+        value = getter(instance)
+        if value is None:
+            return u''
+        key = (type(value), value.pk)
+        rendered = cache.get(key)
+        if rendered is None:
+            rendered = unicode(value)
+            cache.set(key, rendered)
+        return rendered
+
+    return render
+
+
+def _cached_manager_renderer(name, cache):
+    """
+    Builds a renderer for reverse foreign keys and many to many fields,
+    caching the rendered lists by model and set of primary keys
+    """
+    getter = attrgetter(name)
+
+    def render(instance):
+        objects = getter(instance).all()
+        key = (objects.model, frozenset([obj.pk for obj in objects]))
+        rendered = cache.get(key)
+        if rendered is None:
+            rendered = u', '.join(map(unicode, objects))
+            cache.set(key, rendered)
+        return rendered
+
+    return render
+
+
+def _cached_custom_renderer(name, render, cache):
+    """
+    Wraps a custom renderer decorated with `reportato.decorators.cached_column`
+    """
+    get_key = render.cache_key
+    missing = object()
+
+    def cached(instance):
+        key = (name, get_key(instance))
+        value = cache.get(key, missing)
+        if value is missing:
+            value = render(instance)
+            cache.set(key, value)
+        return value
+
+    return cached
+
+
+def _deferred_field_checker(name, render, field_names):
+    """
+    Wraps a custom renderer declaring its fields with
+    `reportato.decorators.requires`, warning if it reads a field that wasn't
+    fetched. Used in debug mode only
+    """
+    state = {'warned': False}
+
+    def checked(instance):
+        loaded = set(instance.__dict__)
+        value = render(instance)
+        if not state['warned']:
+            deferred = (set(instance.__dict__) - loaded) & field_names
+            if deferred:
+                state['warned'] = True
+                warnings.warn(
+                    'get_%s_column reads the deferred field(s) %s, you may need '
+                    'to add them to its `requires` decorator' % (
+                        name, ', '.join(sorted(deferred))),
+                    DeferredFieldWarning)
+        return value
+
+    return checked
+
+
+def _get_field_kind(field, direct, m2m):
+    """
+    Classifies a field as returned by `Options.get_field_by_name`
+    """
+    if m2m:
+        return MANY_TO_MANY
+    if direct:
+        if field.rel is not None:
+            return FOREIGN_KEY
+        return PLAIN_FIELD if field.column else None
+    if isinstance(field.field, OneToOneField):
+        # reverse one to one relations can be joined as well
+        return FOREIGN_KEY
+    return REVERSE_FOREIGN_KEY
+
+
+def _resolve_field(model, name):
+    """
+    Returns the kind and default header of the field `name` of `model`
+    """
+    try:
+        field, _, direct, m2m = model._meta.get_field_by_name(name)
+    except FieldDoesNotExist:
+        return None, name.replace('_', ' ').capitalize()
+
+    try:
+        header = field.verbose_name.capitalize()
+    except AttributeError:  # this field doesn't have verbose_name
+        header = name.replace('_', ' ').capitalize()
+    return _get_field_kind(field, direct, m2m), header
+
+
+def _flatten_lookups(lookups, prefix=''):
+    """
+    Turns the nested dict Django uses for `select_related` back into a list
+    of lookups
+    """
+    flat = []
+    for name, children in lookups.iteritems():
+        path = prefix + name
+        flat.append(path)
+        flat.extend(_flatten_lookups(children, path + '__'))
+    return flat
+
+
+def _add_related_lookups(queryset, select_related, prefetch_related):
+    """
+    Adds the given `select_related` and `prefetch_related` lookups to
+    `queryset`, keeping the ones it already had
+    """
+    if select_related and queryset.query.select_related is not True:
+        # Django replaces previous select_related lookups, so keep them
+        if queryset.query.select_related:
+            select_related = select_related + _flatten_lookups(queryset.query.select_related)
+        queryset = queryset.select_related(*select_related)
+
+    prefetch_related = [lookup for lookup in prefetch_related
+                        if lookup not in queryset._prefetch_related_lookups]
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+
+    return queryset
+
+
+def iter_chunks(queryset, chunk_size, keys, get_key):
+    """
+    Iterates over `queryset` fetching `chunk_size` items at a time, using
+    keyset pagination on the ordering `keys`, the last of which must be
+    unique. `get_key` returns the values of the keys for a given item.
+    Prefetches are applied on every chunk
+    """
+    lookup = 'lt' if keys[0].startswith('-') else 'gt'
+    names = [key.lstrip('-') for key in keys]
+    queryset = queryset.order_by(*keys)
+
+    chunk_queryset = queryset
+    while True:
+        chunk = list(chunk_queryset[:chunk_size])
+        for item in chunk:
+            yield item
+
+        if len(chunk) < chunk_size:
+            return
+
+        last = get_key(chunk[-1])
+        del chunk  # release this chunk before fetching the next one
+        if len(names) == 1:
+            condition = Q(**{'%s__%s' % (names[0], lookup): last[0]})
+        else:
+            condition = Q(**{'%s__%s' % (names[0], lookup): last[0]}) | \
+                Q(**{names[0]: last[0], '%s__%s' % (names[1], lookup): last[1]})
+        chunk_queryset = queryset.filter(condition)
+
+
+def iter_server_side(queryset, fetch_size):
+    """
+    Iterates over the rows of a `values_list` queryset using a server-side
+    cursor that fetches `fetch_size` rows at a time. PostgreSQL uses a named
+    cursor, which needs a transaction; other backends use `iterator()`
+    """
+    using = queryset.db
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        for row in queryset.iterator():
+            yield row
+        return
+
+    sql, params = queryset.query.get_compiler(using).as_sql()
+    with transaction.atomic(using=using):
+        cursor = connection.connection.cursor(name='reportato_%s' % uuid.uuid4().hex)
+        cursor.itersize = fetch_size
+        try:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    return
+                for row in rows:
+                    yield row
+        finally:
+            cursor.close()
+
+
+def _only_fields(queryset, fields, local_fields):
+    """
+    Restricts `queryset` to `fields` and the relations it joins, unless
+    `fields` is None or the queryset already defers some fields
+    """
+    deferred_names, defer = queryset.query.deferred_loading
+    if fields is None or deferred_names or not defer:
+        return queryset
+
+    select_related = queryset.query.select_related
+    if select_related is True:
+        return queryset
+
+    fields = list(fields)
+    for name in select_related or ():
+        if name not in local_fields:
+            return queryset
+        fields.append(name)
+
+    return queryset.only(*fields)
+
+
+def _describe_field(name, header=None, kind=None):
+    return FieldDescriptor(name, header, kind, 'get_%s_column' % name,
+                           'get_%s_column_batch' % name)
+
+
 class ModelReporterOptions(object):
 
     def __init__(self, options=None):
@@ -21,10 +343,67 @@ class ModelReporterOptions(object):
                 model = MyModel
                 fields = ('some', 'stuff')
                 custom_headers = {'some': 'Different header'}
+                use_values_list = True
+                select_related = ('some__relation',)
+                prefetch_related = ('stuff__children',)
+                only_required_fields = True
+                chunk_size = 5000
+                chunk_ordering = 'created'
+                fetch_size = 2000
+                change_tracking_field = 'updated_at'
+                key_field = 'id'
+                annotations = {'children_count': Count('children')}
+                render_cache_size = 10000
+                column_batch_size = 1000
+
+        `use_values_list` enables fetching the rows with `values_list` when
+        every visible field is a plain model column without a custom renderer.
+
+        Relations used by the visible fields are joined or prefetched
+        automatically; `select_related` and `prefetch_related` add extra
+        lookups, e.g. the ones needed by custom `get_FIELD_column` methods.
+
+        With `chunk_size`, querysets are fetched in chunks of that many rows
+        using keyset pagination on `chunk_ordering` (the primary key by default)
+        so memory is bounded by the size of a chunk instead of the table's.
+
+        With `fetch_size`, the primary keys of querysets are streamed through
+        a server-side cursor, keeping their ordering, and the items are
+        fetched in blocks of that many rows. It takes precedence over
+        `chunk_size`.
+
+        `change_tracking_field` is a field that increases every time a row
+        changes (e.g. an `auto_now` timestamp), used to render only the rows
+        changed since a previous export. `key_field` is the visible field
+        identifying every row when merging those (the primary key by default).
+
+        `annotations` defines columns computed by the database: aggregates or
+        other expressions are added with `annotate()`, and strings are added
+        as raw SQL with `extra(select=...)`.
+
+        `render_cache_size` enables caching the rendered related objects, and
+        the values of custom columns decorated with
+        `reportato.decorators.cached_column`, keeping up to that many values.
+
+        Fields with a `get_FIELD_column_batch(values)` method are rendered
+        `column_batch_size` rows at a time: the method gets a list with the
+        raw values of the column and returns the list of rendered ones.
         """
         self.model = getattr(options, 'model', None)
         self.fields = getattr(options, 'fields', None)
         self.custom_headers = getattr(options, 'custom_headers', None)
+        self.use_values_list = getattr(options, 'use_values_list', False)
+        self.select_related = getattr(options, 'select_related', ())
+        self.prefetch_related = getattr(options, 'prefetch_related', ())
+        self.only_required_fields = getattr(options, 'only_required_fields', True)
+        self.chunk_size = getattr(options, 'chunk_size', None)
+        self.chunk_ordering = getattr(options, 'chunk_ordering', 'pk')
+        self.fetch_size = getattr(options, 'fetch_size', None)
+        self.change_tracking_field = getattr(options, 'change_tracking_field', None)
+        self.key_field = getattr(options, 'key_field', None)
+        self.annotations = getattr(options, 'annotations', None) or {}
+        self.render_cache_size = getattr(options, 'render_cache_size', None)
+        self.column_batch_size = getattr(options, 'column_batch_size', 1000)
 
 
 class ModelReporterMetaclass(type):
@@ -45,23 +424,41 @@ class ModelReporterMetaclass(type):
         opts = new_class._meta = ModelReporterOptions(
             getattr(new_class, 'Meta', None))
         if opts.model:
+            model_field_names = opts.model._meta.get_all_field_names()
+            clashing_annotations = [annotation for annotation in opts.annotations
+                                    if annotation in model_field_names]
+            if clashing_annotations:
+                message = 'Annotation(s) (%s) clash with fields of %s'
+                message = message % (', '.join(clashing_annotations),
+                                     opts.model.__name__)
+                raise FieldError(message)
+
             all_model_fields = [field.name for field in opts.model._meta.fields]
             if opts.fields is None:
-                new_class.fields = all_model_fields
+                new_class.fields = all_model_fields + list(opts.annotations)
             else:
                 new_class.fields = opts.fields
 
-            headers = []
-            for field_name in new_class.fields:
+            ordering = opts.chunk_ordering.lstrip('-')
+            if ordering != 'pk':
                 try:
-                    field = opts.model._meta.get_field_by_name(field_name)[0]
-                    header_title = field.verbose_name.capitalize()
-                except (AttributeError, FieldDoesNotExist):  # this field doesn't have verbose_name
-                    header_title = field_name.replace('_', ' ').capitalize()
-
-                headers.append((field_name, header_title))
+                    ordering_field = opts.model._meta.get_field(ordering)
+                except FieldDoesNotExist:
+                    raise ImproperlyConfigured(
+                        '`chunk_ordering` of %s needs to be a field of %s, not %s' % (
+                            name, opts.model.__name__, ordering))
+                if ordering_field.null:
+                    # keyset pagination can't go past NULL values
+                    raise ImproperlyConfigured(
+                        '`chunk_ordering` of %s needs to be a non nullable field, '
+                        'and %s is nullable' % (name, ordering))
+                if ordering_field.rel is not None:
+                    # relations are ordered by the related model, but filtered
+                    # by their ids
+                    raise ImproperlyConfigured(
+                        '`chunk_ordering` of %s needs to be a field that isn\'t '
+                        'a relation, and %s is one' % (name, ordering))
 
-            new_class.headers = SortedDict(headers)
             if opts.custom_headers is not None:
                 missing_headers = set(opts.custom_headers.keys()) - set(new_class.fields)
                 if missing_headers:
@@ -69,7 +466,37 @@ class ModelReporterMetaclass(type):
                     message = message % (', '.join(missing_headers),
                                          opts.model.__name__)
                     raise FieldError(message)
-                new_class.headers.update(opts.custom_headers)
+            custom_headers = opts.custom_headers or {}
+
+            # fields already resolved by parent reporters of the same model
+            # aren't resolved again
+            resolved_fields = {}
+            for base in reversed(new_class.__mro__[1:]):
+                base_opts = getattr(base, '_meta', None)
+                if base_opts is not None and base_opts.model is opts.model:
+                    resolved_fields.update(base._resolved_fields)
+
+            field_table = []
+            for field_name in new_class.fields:
+                if field_name not in resolved_fields:
+                    resolved_fields[field_name] = _resolve_field(opts.model, field_name)
+                kind, header = resolved_fields[field_name]
+                if field_name in opts.annotations:
+                    kind = ANNOTATION
+
+                field_table.append(_describe_field(
+                    field_name, custom_headers.get(field_name, header), kind))
+
+            new_class._resolved_fields = resolved_fields
+            new_class.field_table = tuple(field_table)
+            new_class._field_descriptors = dict(
+                (descriptor.name, descriptor) for descriptor in field_table)
+            new_class.headers = SortedDict(
+                (descriptor.name, descriptor.header) for descriptor in field_table)
+            new_class.field_kinds = dict(
+                (descriptor.name, descriptor.kind) for descriptor in field_table
+                if descriptor.kind is not None)
+            new_class._header_rows = {}
 
         return new_class
 
@@ -86,7 +513,7 @@ class ModelReporter(object):
         outputted on this instance of ModelReporter. If none, then all
         fields are included.
         """
-        if not items:
+        if items is None:
             items = self._meta.model.objects.all()
         self.items = items
 
@@ -94,24 +521,457 @@ class ModelReporter(object):
             visible_fields = self.fields
         self.visible_fields = visible_fields
 
+        self.chunk_size = self._meta.chunk_size
+        self.fetch_size = self._meta.fetch_size
+        # a `reportato.instrumentation.ReportInstrument` measuring the report
+        self.instrument = None
+        self.render_cache = None
+        if self._meta.render_cache_size:
+            self.render_cache = LRUCache(self._meta.render_cache_size)
+        self._column_renderers = (None, None)
+
     def get_header_row(self):
         """
         Returns a sorted list with the field's headers
         """
-        return [v for k, v in self.headers.iteritems() if k in self.visible_fields]
+        key = tuple(self.visible_fields)
+        header_row = self._header_rows.get(key)
+        if header_row is None:
+            visible_fields = set(key)
+            header_row = tuple(header for name, header in self.headers.iteritems()
+                               if name in visible_fields)
+            if len(self._header_rows) >= HEADER_ROWS_CACHE_SIZE:
+                self._header_rows.clear()
+            self._header_rows[key] = header_row
+        return list(header_row)
+
+    def get_related_lookups(self):
+        """
+        Returns a tuple with the lists of `select_related` and
+        `prefetch_related` lookups needed by the visible fields
+        """
+        select_related = list(self._meta.select_related)
+        prefetch_related = list(self._meta.prefetch_related)
+        for name in self.visible_fields:
+            kind = self.field_kinds.get(name)
+            if kind == FOREIGN_KEY:
+                select_related.append(name)
+            elif kind in (REVERSE_FOREIGN_KEY, MANY_TO_MANY):
+                prefetch_related.append(name)
+
+        return select_related, prefetch_related
+
+    def annotate(self, queryset):
+        """
+        Adds the visible annotations to `queryset`, so the database computes
+        them
+        """
+        annotations, extra_select = {}, {}
+        for name in self.visible_fields:
+            if self.field_kinds.get(name) == ANNOTATION:
+                expression = self._meta.annotations[name]
+                if isinstance(expression, basestring):
+                    extra_select[name] = expression
+                else:
+                    annotations[name] = expression
+
+        if extra_select:
+            queryset = queryset.extra(select=extra_select)
+        if annotations:
+            queryset = queryset.annotate(**annotations)
+        return queryset
+
+    def get_items(self):
+        """
+        Returns the items to iterate over. Querysets get the visible
+        annotations, and the relations used by the report joined or
+        prefetched, so rendering them doesn't trigger extra queries per row
+        """
+        items = self.items
+        if not isinstance(items, QuerySet):
+            return items
+        return self._prepare_queryset(items)
+
+    def _prepare_queryset(self, queryset):
+        queryset = self.annotate(queryset)
+        queryset = _add_related_lookups(queryset, *self.get_related_lookups())
+        return self._only_required_fields(queryset)
+
+    def _get_local_field_names(self):
+        return set(field.name for field in self._meta.model._meta.fields)
+
+    def get_required_fields(self):
+        """
+        Returns the names of the model fields needed to render the visible
+        fields, or None if they can't be known, e.g. because a custom column
+        doesn't declare the fields it reads
+        """
+        cls = type(self)
+        if self._overrides_get_row() or \
+                cls._render_field.__func__ is not ModelReporter._render_field.__func__ or \
+                cls._default_field_renderer.__func__ is not ModelReporter._default_field_renderer.__func__:
+            return None
+
+        local_fields = self._get_local_field_names()
+        required = set([self._meta.model._meta.pk.name])
+        for descriptor, custom_renderer, _ in self._get_field_plan():
+            name, kind = descriptor.name, descriptor.kind
+            if custom_renderer is not None:
+                fields = getattr(custom_renderer, 'required_fields', None)
+                if fields is None:
+                    return None
+                required.update(fields)
+            elif kind in (PLAIN_FIELD, FOREIGN_KEY):
+                if name not in local_fields:
+                    # reverse one to one relations
+                    return None
+                required.add(name)
+            elif kind not in (REVERSE_FOREIGN_KEY, MANY_TO_MANY, ANNOTATION):
+                return None
+
+        # the relations followed by extra lookups, and the chunk ordering
+        for lookup in list(self._meta.select_related) + list(self._meta.prefetch_related):
+            name = lookup.split('__')[0]
+            if name in local_fields:
+                required.add(name)
+        ordering = self._meta.chunk_ordering.lstrip('-')
+        if ordering != 'pk':
+            required.add(ordering)
+
+        return sorted(required)
+
+    def _only_required_fields(self, queryset):
+        """
+        Restricts `queryset` to the fields needed by the report, unless it
+        already defers some fields
+        """
+        if not self._meta.only_required_fields:
+            return queryset
+        return _only_fields(queryset, self.get_required_fields(),
+                            self._get_local_field_names())
+
+    def _get_change_tracking_field(self):
+        field = self._meta.change_tracking_field
+        if field is None:
+            raise ImproperlyConfigured(
+                '%s needs a `change_tracking_field`' % type(self).__name__)
+        return field
+
+    def get_watermark(self):
+        """
+        Returns the highest value of the change tracking field among the items.
+        Rows changed after an export have a higher value than its watermark
+        """
+        field = self._get_change_tracking_field()
+        return self.items.aggregate(watermark=Max(field))['watermark']
+
+    def changed_since(self, watermark):
+        """
+        Returns a new reporter with the items changed after `watermark`, or
+        all of them if it's None
+        """
+        field = self._get_change_tracking_field()
+        items = self.items
+        if watermark is not None:
+            items = items.filter(**{'%s__gt' % field: watermark})
+
+        reporter = type(self)(items, self.visible_fields)
+        reporter.chunk_size = self.chunk_size
+        reporter.fetch_size = self.fetch_size
+        reporter.instrument = self.instrument
+        return reporter
 
     def get_rows(self):
         """
         Returns an iterable with the different rows of the given queryset / list
         """
-        for item in self.items:
-            yield self.get_row(item).values()
+        return self._get_rows(raw=False)
+
+    def get_raw_rows(self):
+        """
+        Like `get_rows()`, but model fields are returned as they are instead
+        of being converted to unicode, e.g. for writers with typed cells
+        """
+        return self._get_rows(raw=True)
+
+    def get_row_batches(self, batch_size=1000, raw=False):
+        """
+        Returns an iterator of lists of up to `batch_size` rows. Every batch
+        is fetched and rendered by a single `next()` call, so the report can
+        be driven one batch at a time, e.g. from a pool of worker threads
+        """
+        return batched(self._get_rows(raw), batch_size)
+
+    def _overrides_get_row(self):
+        return type(self).get_row.__func__ is not ModelReporter.get_row.__func__
+
+    def _get_rows(self, raw):
+        batch_renderers = [] if self._overrides_get_row() else self._get_batch_renderers()
+        if self._can_use_values_list():
+            # batch columns get raw values, so the others are rendered later
+            rows = self._get_rows_from_values(raw or bool(batch_renderers))
+            render_values = not raw
+        else:
+            rows = self._get_rows_from_instances(raw, batched=bool(batch_renderers))
+            render_values = False
+
+        if batch_renderers:
+            rows = self._render_column_batches(rows, batch_renderers, render_values)
+        if self.instrument is not None:
+            rows = self.instrument.track_rows(rows, self)
+        return rows
+
+    def _get_batch_renderers(self):
+        """
+        Returns a list of `(index, method)` tuples with the visible fields
+        rendered by a `get_FIELD_column_batch` method
+        """
+        if type(self)._render_field.__func__ is not ModelReporter._render_field.__func__:
+            return []
+        return [(index, batch_renderer)
+                for index, (_, custom_renderer, batch_renderer)
+                in enumerate(self._get_field_plan())
+                if batch_renderer is not None and custom_renderer is None]
+
+    def _render_column_batches(self, rows, batch_renderers, render_values):
+        """
+        Renders the columns with a `get_FIELD_column_batch` method a batch of
+        rows at a time. With `render_values` the other columns are converted
+        to unicode as well
+        """
+        batch_indexes = set(index for index, _ in batch_renderers)
+        for batch in batched(rows, self._meta.column_batch_size):
+            columns = zip(*batch)
+            for index, render in batch_renderers:
+                column = render(list(columns[index]))
+                if len(column) != len(batch):
+                    raise ValueError(
+                        'get_%s_column_batch returned %d values for %d rows' % (
+                            self.visible_fields[index], len(column), len(batch)))
+                columns[index] = column
+            if render_values:
+                for index, column in enumerate(columns):
+                    if index not in batch_indexes:
+                        columns[index] = [_render_value(value) for value in column]
+
+            for row in zip(*columns):
+                yield list(row)
+
+    def _get_rows_from_instances(self, raw=False, batched=False):
+        if self._can_use_server_side_cursor():
+            items = self._iter_fetched_blocks(self._prepare_queryset,
+                                              lambda item: item.pk)
+        else:
+            items = self.get_items()
+        if self._can_chunk(items):
+            ordering = self._get_chunk_keys()[0].lstrip('-')
+            if ordering == 'pk':
+                get_key = lambda item: (item.pk,)
+            else:
+                get_key = lambda item: (getattr(item, ordering), item.pk)
+            items = self._iter_chunks(items, get_key)
+
+        if not raw and self._overrides_get_row():
+            # keep calling overridden row renderers
+            for item in items:
+                yield self.get_row(item).values()
+            return
+
+        if raw or batched:
+            renderers = self.get_column_renderers(raw=raw, batched=batched)
+        else:
+            renderers = self._get_cached_renderers(refresh=True)
+        for item in items:
+            yield [render(item) for render in renderers]
+
+    def _get_rows_from_values(self, raw=False):
+        """
+        Fast path: fetches plain columns with `values_list`, skipping the
+        creation of model instances
+        """
+        if self._can_use_server_side_cursor():
+            # the primary key is fetched as an extra column at the end of every row
+            fields = list(self.visible_fields) + ['pk']
+            for values in self._iter_fetched_blocks(
+                    lambda queryset: self.annotate(queryset).values_list(*fields),
+                    lambda values: values[-1]):
+                values = values[:-1]
+                yield list(values) if raw else [_render_value(value) for value in values]
+            return
+
+        items = self.annotate(self.items)
+        if not self._can_chunk(items):
+            for values in items.values_list(*self.visible_fields):
+                yield list(values) if raw else [_render_value(value) for value in values]
+            return
+
+        # the keys are fetched as extra columns at the end of every row
+        width = len(self.visible_fields)
+        keys = [key.lstrip('-') for key in self._get_chunk_keys()]
+        queryset = items.values_list(*(list(self.visible_fields) + keys))
+
+        for values in self._iter_chunks(queryset, lambda values: values[width:]):
+            values = values[:width]
+            yield list(values) if raw else [_render_value(value) for value in values]
+
+    def _can_use_server_side_cursor(self):
+        return bool(self.fetch_size) and isinstance(self.items, QuerySet)
+
+    def _iter_fetched_blocks(self, prepare, get_pk):
+        """
+        Streams the primary keys of the items with a server-side cursor, and
+        fetches the items in blocks of `fetch_size` using `prepare`, which
+        returns the queryset to fetch them with. Items are yielded in the
+        order of the primary keys, and prefetches are applied on every block
+        """
+        queryset = self.items._clone()
+        # sliced querysets can't be filtered any further, and the slice is
+        # already applied to the primary keys
+        queryset.query.clear_limits()
+        queryset = prepare(queryset).order_by()
+
+        pks = iter_server_side(self.items.values_list('pk'), self.fetch_size)
+        for block in batched(pks, self.fetch_size):
+            block = [row[0] for row in block]
+            items = dict((get_pk(item), item) for item in queryset.filter(pk__in=block))
+            for pk in block:
+                if pk in items:  # unless it was deleted in the meantime
+                    yield items[pk]
+            del items  # release this block before fetching the next one
+
+    def _can_chunk(self, items):
+        """
+        Only unsliced querysets can be paginated
+        """
+        return bool(self.chunk_size) and isinstance(items, QuerySet) \
+            and items.query.can_filter()
+
+    def _get_chunk_keys(self):
+        """
+        Returns the ordering used for keyset pagination. The primary key is
+        added as a tie breaker when paginating on a different field
+        """
+        ordering = self._meta.chunk_ordering
+        if ordering.lstrip('-') == 'pk':
+            return [ordering]
+        return [ordering, '-pk' if ordering.startswith('-') else 'pk']
+
+    def _iter_chunks(self, queryset, get_key):
+        """
+        Iterates over `queryset` fetching `chunk_size` items at a time, using
+        keyset pagination. `get_key` returns the values of the ordering keys
+        for a given item
+        """
+        return iter_chunks(queryset, self.chunk_size, self._get_chunk_keys(), get_key)
+
+    def _can_use_values_list(self):
+        """
+        `values_list` can only be used on querysets where every visible field
+        is a model column or annotation that doesn't need a custom renderer
+        """
+        if not self._meta.use_values_list or not isinstance(self.items, QuerySet) or \
+                self._overrides_get_row():
+            return False
+
+        cls = type(self)
+        if cls._render_field.__func__ is not ModelReporter._render_field.__func__ or \
+                cls._default_field_renderer.__func__ is not ModelReporter._default_field_renderer.__func__:
+            # overridden field handlers need instances
+            return False
+
+        for descriptor, custom_renderer, _ in self._get_field_plan():
+            if descriptor.kind not in (PLAIN_FIELD, ANNOTATION) or \
+                    custom_renderer is not None:
+                return False
+
+        return True
+
+    def _get_field_plan(self):
+        """
+        Returns a `(descriptor, custom renderer, batch renderer)` tuple for
+        every visible field, with the methods named by the field table, or
+        None if the reporter doesn't define them
+        """
+        descriptors = getattr(self, '_field_descriptors', {})
+        plan = []
+        for name in self.visible_fields:
+            descriptor = descriptors.get(name) or _describe_field(name)
+            plan.append((descriptor, getattr(self, descriptor.renderer_name, None),
+                         getattr(self, descriptor.batch_renderer_name, None)))
+        return plan
 
     def get_row(self, instance):
         """
         Returns a soreted dictionary with a single row
         """
-        return SortedDict([(name, self._render_field(instance, name)) for name in self.fields and self.visible_fields])
+        renderers = self._get_cached_renderers()
+        return SortedDict([(name, render(instance)) for name, render in zip(self.visible_fields, renderers)])
+
+    def get_column_renderers(self, raw=False, batched=False):
+        """
+        Returns a tuple with the function that renders each visible field for
+        a given instance, so looking up custom methods happens once per report
+        instead of once per cell. With `raw`, model fields are returned as
+        they are. With `batched`, fields with a `get_FIELD_column_batch`
+        method return their raw values, to be rendered a batch at a time
+        """
+        renderers = self._build_column_renderers(raw, batched)
+        if self.instrument is not None and self.instrument.started is not None:
+            return self.instrument.wrap_renderers(self.visible_fields, renderers)
+        return renderers
+
+    def _build_column_renderers(self, raw, batched=False):
+        cls = type(self)
+        if cls._render_field.__func__ is not ModelReporter._render_field.__func__:
+            # keep calling overridden field handlers
+            return tuple(partial(self._render_field, name=name)
+                         for name in self.visible_fields)
+
+        default_renderer = cls._default_field_renderer.__func__ is ModelReporter._default_field_renderer.__func__
+        cache = self.render_cache
+        field_names = set(field.attname for field in self._meta.model._meta.fields)
+
+        renderers = []
+        for descriptor, custom_renderer, batch_renderer in self._get_field_plan():
+            name, kind = descriptor.name, descriptor.kind
+            if custom_renderer is not None:
+                render = custom_renderer
+                if cache is not None and hasattr(custom_renderer, 'cache_key'):
+                    render = _cached_custom_renderer(name, render, cache)
+                if settings.DEBUG and hasattr(custom_renderer, 'required_fields'):
+                    render = _deferred_field_checker(name, render, field_names)
+                renderers.append(render)
+            elif batch_renderer is not None:
+                getter = _value_getter(name, kind)
+                if not batched:
+                    getter = _single_value_renderer(getter, batch_renderer)
+                renderers.append(getter)
+            elif not default_renderer or kind is None:
+                renderers.append(partial(self._default_field_renderer, name=name))
+            elif kind in (REVERSE_FOREIGN_KEY, MANY_TO_MANY):
+                if cache is not None:
+                    renderers.append(_cached_manager_renderer(name, cache))
+                else:
+                    renderers.append(_manager_renderer(name))
+            elif raw:
+                renderers.append(attrgetter(name))
+            elif kind == FOREIGN_KEY and cache is not None:
+                renderers.append(_cached_related_renderer(name, cache))
+            else:
+                renderers.append(_attribute_renderer(name))
+
+        return tuple(renderers)
+
+    def _get_cached_renderers(self, refresh=False):
+        """
+        Returns the column renderers for the current visible fields, building
+        them if needed
+        """
+        visible_fields, renderers = self._column_renderers
+        if refresh or visible_fields != tuple(self.visible_fields):
+            renderers = self.get_column_renderers()
+            self._column_renderers = (tuple(self.visible_fields), renderers)
+        return renderers
 
     def _default_field_renderer(self, instance, name):
         """
@@ -125,12 +985,10 @@ class ModelReporter(object):
 
         value = getattr(instance, name, None)
 
-        if value is None:
-            return u''
         if isinstance(value, Manager):
             return u', '.join(map(unicode, value.all()))
 
-        return unicode(value)
+        return _render_value(value)
 
     def _render_field(self, instance, name):
         """
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent by `reportato.instrumentation.ReportInstrument` once a report is
+# finished, with the `reportato.instrumentation.ReportMetrics` of it
+report_finished = Signal(providing_args=['reporter', 'metrics'])
@@ -1,15 +1,45 @@
 # coding=utf-8
+import datetime, gzip, hashlib, io, json, os, shutil, stat, tempfile, threading, time, unittest, warnings, zipfile, zlib
+from decimal import Decimal
+
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group, Permission
 from django.contrib.contenttypes.models import ContentType
-from django.core.exceptions import FieldError
+from django.core.exceptions import FieldError, ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import Count
+from django.http import StreamingHttpResponse
 from django.test import TestCase, RequestFactory
+from django.test.utils import override_settings
 
 from mock import Mock, patch
 
-from .reporters import ModelReporter, UndefinedField
-from .utils import UnicodeWriter
-from .views import BaseCSVGeneratorView
+from .batch import export_batch, get_batch_queryset
+from .cache import (
+    DjangoReportCache, FileSystemReportCache, get_queryset_fingerprint,
+    get_through_models)
+from .columnar import ARROW, get_column_types, pyarrow, write_columnar
+from .decorators import cached_column, column_type, requires
+from .delta import merge_delta, write_delta
+from .export import export_many, export_to_file, get_manifest_path, get_version_path
+from .instrumentation import ReportInstrument
+from .jobs import (
+    PENDING, READY, FileSystemReportStorage, ReportJobManager,
+    SynchronousJobBackend, ThreadPoolJobBackend, get_report_key, get_row_range)
+from .parallel import (
+    _close_connections, _drop_connections, export_parallel, get_shards)
+from .signals import report_finished
+from .reporters import (
+    ANNOTATION, FOREIGN_KEY, MANY_TO_MANY, PLAIN_FIELD, DeferredFieldWarning,
+    FieldDescriptor, ModelReporter, UndefinedField)
+from .utils import (
+    BufferedUnicodeWriter, CompressedStream, LRUCache, UnicodeWriter, batched,
+    compress_chunks)
+from .views import (
+    BackgroundReportMixin, BaseCSVGeneratorView, BaseXLSXGeneratorView,
+    CachedReportMixin)
+from .xlsx import XLSXWriter
 
 
 class ModelReporterMetaclassTestCase(TestCase):
@@ -28,6 +58,42 @@ class ModelReporterMetaclassTestCase(TestCase):
             'Unknown header(s) (foo, span) specified for Permission'
         )
 
+    def test_nullable_chunk_ordering(self):
+        from django.contrib.admin.models import LogEntry
+
+        with self.assertRaises(ImproperlyConfigured) as exception:
+            class ThisShouldFail(ModelReporter):
+                class Meta:
+                    model = LogEntry
+                    chunk_size = 10
+                    chunk_ordering = '-object_id'
+
+        self.assertEqual(
+            exception.exception.message,
+            '`chunk_ordering` of ThisShouldFail needs to be a non nullable '
+            'field, and object_id is nullable'
+        )
+
+        with self.assertRaises(ImproperlyConfigured):
+            class ThisShouldFailToo(ModelReporter):
+                class Meta:
+                    model = LogEntry
+                    chunk_ordering = 'foo'
+
+    def test_relation_chunk_ordering(self):
+        with self.assertRaises(ImproperlyConfigured) as exception:
+            class ThisShouldFail(ModelReporter):
+                class Meta:
+                    model = Permission
+                    chunk_size = 2
+                    chunk_ordering = 'content_type'
+
+        self.assertEqual(
+            exception.exception.message,
+            '`chunk_ordering` of ThisShouldFail needs to be a field that isn\'t '
+            'a relation, and content_type is one'
+        )
+
     def test_custom_header_with_non_selected_field(self):
         with self.assertRaises(FieldError) as exception:
             class ThisShouldFail(ModelReporter):
@@ -41,6 +107,40 @@ class ModelReporterMetaclassTestCase(TestCase):
             'Unknown header(s) (codename) specified for Permission'
         )
 
+    def test_annotation_clashing_with_fields(self):
+        with self.assertRaises(FieldError) as exception:
+            class ThisShouldFail(ModelReporter):
+                class Meta:
+                    model = Permission
+                    annotations = {'name': 'UPPER(name)'}
+
+        self.assertEqual(
+            exception.exception.message,
+            'Annotation(s) (name) clash with fields of Permission'
+        )
+
+
+    def test_field_table(self):
+        self.assertEqual(PermissionReporterWithSomeFieldsAndCustomRenderer.field_table, (
+            FieldDescriptor('name', u'Name', PLAIN_FIELD, 'get_name_column',
+                            'get_name_column_batch'),
+            FieldDescriptor('codename', u'Codename', PLAIN_FIELD, 'get_codename_column',
+                            'get_codename_column_batch'),
+        ))
+
+    def test_subclasses_reuse_resolved_fields(self):
+        with patch('reportato.reporters._resolve_field',
+                   return_value=(PLAIN_FIELD, u'Header')) as resolve_field:
+            class ChildReporter(PermissionReporterWithSomeFields):
+                class Meta:
+                    model = Permission
+                    fields = ('name', 'codename', 'content_type')
+                    custom_headers = {'name': 'Title'}
+
+        resolve_field.assert_called_once_with(Permission, 'content_type')
+        self.assertEqual(ChildReporter().get_header_row(),
+                         [u'Title', u'Codename', u'Header'])
+
 
 # Test classes
 class BaseUserReporter(ModelReporter):
@@ -48,6 +148,28 @@ class BaseUserReporter(ModelReporter):
         model = get_user_model()
 
 
+class ChunkedUserReporter(ModelReporter):
+    class Meta:
+        model = get_user_model()
+        fields = ('username', 'last_name')
+        chunk_size = 2
+
+
+class UserReporterChunkedByLastName(ModelReporter):
+    class Meta:
+        model = get_user_model()
+        fields = ('username', 'last_name')
+        chunk_size = 2
+        chunk_ordering = '-last_name'
+
+
+class IncrementalUserReporter(ModelReporter):
+    class Meta:
+        model = get_user_model()
+        fields = ('id', 'username', 'last_name')
+        change_tracking_field = 'last_login'
+
+
 class UserReporterWithCustomHeaders(ModelReporter):
     class Meta:
         model = get_user_model()
@@ -99,6 +221,80 @@ class GroupReporter(ModelReporter):
         fields = ('name', 'permissions',)
 
 
+class GroupReporterWithRelationHints(ModelReporter):
+    class Meta:
+        model = Group
+        fields = ('name', 'permissions',)
+        prefetch_related = ('permissions__content_type',)
+
+
+class GroupReporterWithAnnotations(ModelReporter):
+    class Meta:
+        model = Group
+        fields = ('name', 'permission_count', 'upper_name')
+        annotations = {
+            'permission_count': Count('permissions'),
+            'upper_name': 'UPPER("auth_group"."name")',
+        }
+
+
+class PermissionReporterWithValuesList(ModelReporter):
+    class Meta:
+        model = Permission
+        fields = ('id', 'name', 'codename', 'content_type')
+        use_values_list = True
+
+
+class UserReporterWithRequirements(ModelReporter):
+    class Meta:
+        model = get_user_model()
+        fields = ('username', 'full_name', 'groups')
+
+    @requires('first_name', 'last_name')
+    def get_full_name_column(self, instance):
+        return instance.get_full_name()
+
+
+class CachedUserReporter(ModelReporter):
+    class Meta:
+        model = get_user_model()
+        fields = ('username', 'groups', 'surname')
+        render_cache_size = 10
+
+    @cached_column(lambda instance: instance.last_name)
+    def get_surname_column(self, instance):
+        return instance.last_name.upper()
+
+
+class BatchUserReporter(ModelReporter):
+    class Meta:
+        model = get_user_model()
+        fields = ('username', 'email', 'groups')
+        chunk_size = 2
+        column_batch_size = 2
+
+    def __init__(self, *args, **kwargs):
+        super(BatchUserReporter, self).__init__(*args, **kwargs)
+        self.batches = []
+
+    def get_email_column_batch(self, values):
+        self.batches.append(len(values))
+        return [value.replace('@', ' at ') for value in values]
+
+    def get_groups_column_batch(self, values):
+        return [u', '.join(sorted(group.name for group in groups)) for groups in values]
+
+
+class BatchPermissionReporter(ModelReporter):
+    class Meta:
+        model = Permission
+        fields = ('id', 'codename')
+        use_values_list = True
+
+    def get_id_column_batch(self, values):
+        return [u'#%s' % value for value in values]
+
+
 class ModelReporterTestCase(TestCase):
 
     def _create_users(self, _quantity=5):
@@ -282,6 +478,530 @@ class ModelReporterTestCase(TestCase):
             ]
         )
 
+    def test_values_list_with_plain_fields(self):
+        ct = ContentType.objects.get_for_model(Permission)
+        permissions = Permission.objects.filter(content_type=ct)
+
+        reporter = PermissionReporterWithValuesList(
+            permissions, visible_fields=('id', 'codename'))
+
+        self.assertTrue(reporter._can_use_values_list())
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                [row for row in reporter.get_rows()],
+                [
+                    [u'1', u'add_permission'],
+                    [u'2', u'change_permission'],
+                    [u'3', u'delete_permission'],
+                ]
+            )
+
+    def test_values_list_falls_back_with_relations(self):
+        ct = ContentType.objects.get_for_model(Permission)
+        permissions = Permission.objects.filter(content_type=ct)
+
+        reporter = PermissionReporterWithValuesList(permissions)
+
+        self.assertFalse(reporter._can_use_values_list())
+        self.assertEqual(
+            [row for row in reporter.get_rows()][0],
+            [u'1', u'Can add permission', u'add_permission', u'permission']
+        )
+
+    def test_values_list_falls_back_with_custom_renderer(self):
+        ct = ContentType.objects.get_for_model(Permission)
+        permissions = Permission.objects.filter(content_type=ct)
+
+        reporter = PermissionReporterWithValuesList(
+            permissions, visible_fields=('id', 'codename'))
+        reporter.get_codename_column = lambda x: x.codename.upper()
+
+        self.assertFalse(reporter._can_use_values_list())
+        self.assertEqual(
+            [row for row in reporter.get_rows()][0],
+            [u'1', u'ADD_PERMISSION']
+        )
+
+    def test_values_list_falls_back_with_field_handlers(self):
+        class RenderFieldReporter(PermissionReporterWithValuesList):
+            def _render_field(self, instance, name):
+                return u'X'
+
+        class DefaultRendererReporter(PermissionReporterWithValuesList):
+            def _default_field_renderer(self, instance, name):
+                return u'Y'
+
+        ct = ContentType.objects.get_for_model(Permission)
+        permissions = Permission.objects.filter(content_type=ct)
+
+        for reporter_class, value in ((RenderFieldReporter, u'X'),
+                                      (DefaultRendererReporter, u'Y')):
+            reporter = reporter_class(permissions, visible_fields=('id', 'codename'))
+            self.assertFalse(reporter._can_use_values_list())
+            self.assertEqual(list(reporter.get_rows())[0], [value, value])
+
+    def test_values_list_falls_back_with_lists(self):
+        ct = ContentType.objects.get_for_model(Permission)
+        permissions = list(Permission.objects.filter(content_type=ct))
+
+        reporter = PermissionReporterWithValuesList(
+            permissions, visible_fields=('id', 'codename'))
+
+        self.assertFalse(reporter._can_use_values_list())
+
+    def test_field_kinds(self):
+        self.assertEqual(PermissionReporterWithAllFields.field_kinds, {
+            'id': PLAIN_FIELD, 'name': PLAIN_FIELD, 'codename': PLAIN_FIELD,
+            'content_type': FOREIGN_KEY,
+        })
+        self.assertEqual(GroupReporter.field_kinds, {
+            'name': PLAIN_FIELD, 'permissions': MANY_TO_MANY,
+        })
+        self.assertEqual(PermissionReporterWithFieldsNotInTheModel.field_kinds, {
+            'name': PLAIN_FIELD, 'codename': PLAIN_FIELD,
+        })
+
+    def test_related_lookups(self):
+        self.assertEqual(
+            PermissionReporterWithAllFields().get_related_lookups(),
+            (['content_type'], [])
+        )
+        self.assertEqual(
+            PermissionReporterWithAllFields(visible_fields=('name',)).get_related_lookups(),
+            ([], [])
+        )
+        self.assertEqual(
+            GroupReporterWithRelationHints().get_related_lookups(),
+            ([], ['permissions__content_type', 'permissions'])
+        )
+
+    def test_foreign_keys_are_joined(self):
+        ct = ContentType.objects.get_for_model(Permission)
+        permissions = Permission.objects.filter(content_type=ct)
+
+        reporter = PermissionReporterWithAllFields(permissions)
+
+        with self.assertNumQueries(1):
+            rows = [row for row in reporter.get_rows()]
+
+        self.assertEqual(rows[0],
+            [u'1', u'Can add permission', u'permission', u'add_permission'])
+
+    def test_previous_select_related_is_kept(self):
+        reporter = PermissionReporterWithAllFields(
+            Permission.objects.select_related('content_type'),
+            visible_fields=('name',))
+        self.assertEqual(reporter.get_items().query.select_related,
+                         {'content_type': {}})
+
+        reporter.visible_fields = ('name', 'content_type')
+        self.assertEqual(reporter.get_items().query.select_related,
+                         {'content_type': {}})
+
+    def test_header_rows_are_cached(self):
+        reporter = PermissionReporterWithAllFields(visible_fields=['name', 'id'])
+        header_row = reporter.get_header_row()
+        header_row.append('foo')
+
+        self.assertEqual(reporter.get_header_row(), [u'Id', u'Name'])
+        self.assertIn(('name', 'id'), PermissionReporterWithAllFields._header_rows)
+        reporter.visible_fields = ('codename',)
+        self.assertEqual(reporter.get_header_row(), [u'Codename'])
+
+    def test_required_fields(self):
+        self.assertEqual(PermissionReporterWithSomeFields().get_required_fields(),
+                         ['codename', 'id', 'name'])
+        self.assertEqual(UserReporterWithRequirements().get_required_fields(),
+                         ['first_name', 'id', 'last_name', 'username'])
+        self.assertEqual(UserReporterChunkedByLastName().get_required_fields(),
+                         ['id', 'last_name', 'username'])
+        self.assertIsNone(PermissionReporterWithSomeFieldsAndCustomRenderer().get_required_fields())
+        self.assertIsNone(PermissionReporterWithFieldsNotInTheModel().get_required_fields())
+
+    def test_only_required_fields_are_fetched(self):
+        reporter = PermissionReporterWithAllFields(visible_fields=('name', 'content_type'))
+
+        self.assertEqual(reporter.get_items().query.deferred_loading,
+                         (set(['id', 'name', 'content_type']), False))
+
+        reporter = PermissionReporterWithAllFields(Permission.objects.defer('codename'))
+        self.assertEqual(reporter.get_items().query.deferred_loading,
+                         (set(['codename']), True))
+
+        reporter = PermissionReporterWithSomeFieldsAndCustomRenderer()
+        self.assertEqual(reporter.get_items().query.deferred_loading, (set(), True))
+
+    def test_deferred_field_warning(self):
+        get_user_model().objects.create(username='foo', first_name='Jon', last_name='Snow')
+
+        class IncompleteRequirementsReporter(UserReporterWithRequirements):
+            @requires('first_name')
+            def get_full_name_column(self, instance):
+                return instance.get_full_name()
+
+        with override_settings(DEBUG=True):
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                self.assertEqual(list(UserReporterWithRequirements().get_rows()),
+                                 [[u'foo', u'Jon Snow', u'']])
+                self.assertEqual(caught, [])
+
+                self.assertEqual(list(IncompleteRequirementsReporter().get_rows()),
+                                 [[u'foo', u'Jon Snow', u'']])
+                self.assertEqual(len(caught), 1)
+                self.assertEqual(caught[0].category, DeferredFieldWarning)
+                self.assertIn('last_name', str(caught[0].message))
+
+    def test_many_to_many_fields_are_prefetched(self):
+        ct = ContentType.objects.get_for_model(Permission)
+        permissions = Permission.objects.filter(content_type=ct)
+
+        for name in ('foo', 'bar', 'baz'):
+            group = Group.objects.create(name=name)
+            group.permissions.add(*permissions)
+
+        reporter = GroupReporterWithRelationHints(Group.objects.order_by('name'))
+
+        # groups, permissions and their content types
+        with self.assertNumQueries(3):
+            rows = [row for row in reporter.get_rows()]
+
+        self.assertEqual(rows[0], [
+            u'bar', u'auth | permission | Can add permission, auth | permission | Can change permission, auth | permission | Can delete permission'
+        ])
+
+    def test_chunked_rows(self):
+        self._create_users(_quantity=5)
+        reporter = ChunkedUserReporter()
+
+        # two full chunks and a last one with a single row
+        with self.assertNumQueries(3):
+            rows = [row for row in reporter.get_rows()]
+
+        self.assertEqual(rows, [
+            [u'foo%s' % i, u'Bloggs %s' % i] for i in range(1, 6)
+        ])
+
+    def test_chunked_rows_with_values_list(self):
+        self._create_users(_quantity=4)
+        reporter = ChunkedUserReporter()
+        reporter._meta.use_values_list = True
+
+        try:
+            # the last query just checks there are no more rows
+            with self.assertNumQueries(3):
+                rows = [row for row in reporter.get_rows()]
+        finally:
+            reporter._meta.use_values_list = False
+
+        self.assertEqual(rows, [
+            [u'foo%s' % i, u'Bloggs %s' % i] for i in range(1, 5)
+        ])
+
+    def test_chunked_rows_with_ordering(self):
+        for username, last_name in [('a', 'Stark'), ('b', 'Lannister'),
+                                    ('c', 'Stark'), ('d', 'Snow'),
+                                    ('e', 'Stark')]:
+            get_user_model().objects.create(username=username, last_name=last_name)
+
+        reporter = UserReporterChunkedByLastName()
+
+        self.assertEqual([row for row in reporter.get_rows()], [
+            [u'e', u'Stark'], [u'c', u'Stark'], [u'a', u'Stark'],
+            [u'd', u'Snow'], [u'b', u'Lannister'],
+        ])
+
+    def test_chunks_are_prefetched(self):
+        ct = ContentType.objects.get_for_model(Permission)
+        permissions = Permission.objects.filter(content_type=ct)
+
+        for name in ('foo', 'bar', 'baz'):
+            group = Group.objects.create(name=name)
+            group.permissions.add(*permissions)
+
+        reporter = GroupReporterWithRelationHints()
+        reporter.chunk_size = 2
+
+        # groups, permissions and content types for each one of the two chunks
+        with self.assertNumQueries(6):
+            rows = [row for row in reporter.get_rows()]
+
+        self.assertEqual([row[0] for row in rows], [u'foo', u'bar', u'baz'])
+
+    def test_sliced_querysets_are_not_chunked(self):
+        self._create_users(_quantity=5)
+        reporter = ChunkedUserReporter(get_user_model().objects.all()[:3])
+
+        self.assertFalse(reporter._can_chunk(reporter.get_items()))
+        self.assertEqual(len([row for row in reporter.get_rows()]), 3)
+
+    def test_server_side_cursor_keeps_ordering(self):
+        for username, last_name in [('a', 'Stark'), ('b', 'Lannister'),
+                                    ('c', 'Stark'), ('d', 'Snow'),
+                                    ('e', 'Stark')]:
+            get_user_model().objects.create(username=username, last_name=last_name)
+        queryset = get_user_model().objects.order_by('last_name', '-username')
+        reporter = ChunkedUserReporter(queryset)
+        reporter.fetch_size = 2
+        expected = [[u'b', u'Lannister'], [u'd', u'Snow'], [u'e', u'Stark'],
+                    [u'c', u'Stark'], [u'a', u'Stark']]
+
+        # the primary keys, and then the users of each block
+        with self.assertNumQueries(4):
+            self.assertEqual(list(reporter.get_rows()), expected)
+
+        reporter._meta.use_values_list = True
+        try:
+            with self.assertNumQueries(4):
+                self.assertEqual(list(reporter.get_rows()), expected)
+        finally:
+            reporter._meta.use_values_list = False
+
+        reporter = ChunkedUserReporter(queryset[1:4])
+        reporter.fetch_size = 2
+        self.assertEqual(list(reporter.get_rows()), expected[1:4])
+
+    def test_server_side_cursor_with_sliced_annotated_queryset(self):
+        class GroupCountReporter(ModelReporter):
+            class Meta:
+                model = get_user_model()
+                fields = ('username', 'group_count')
+
+            def get_group_count_column(self, instance):
+                return unicode(instance.group_count)
+
+        group = Group.objects.create(name='Stark')
+        for username in ('a', 'b', 'c', 'd'):
+            user = get_user_model().objects.create(username=username)
+            if username != 'c':
+                user.groups.add(group)
+        queryset = get_user_model().objects.annotate(
+            group_count=Count('groups')).order_by('-username')[1:4]
+        reporter = GroupCountReporter(queryset)
+        expected = list(reporter.get_rows())
+        reporter.fetch_size = 2
+
+        self.assertEqual(expected, [[u'c', u'0'], [u'b', u'1'], [u'a', u'1']])
+        self.assertEqual(list(reporter.get_rows()), expected)
+
+    def test_server_side_cursor_blocks_are_prefetched(self):
+        permissions = Permission.objects.filter(
+            content_type=ContentType.objects.get_for_model(Permission))
+        for name in ('foo', 'bar', 'baz'):
+            group = Group.objects.create(name=name)
+            group.permissions.add(*permissions)
+
+        reporter = GroupReporterWithRelationHints(Group.objects.order_by('name'))
+        reporter.fetch_size = 2
+
+        # the primary keys, and groups, permissions and content types per block
+        with self.assertNumQueries(7):
+            rows = [row for row in reporter.get_rows()]
+
+        self.assertEqual([row[0] for row in rows], [u'bar', u'baz', u'foo'])
+
+    def test_column_renderers(self):
+        reporter = PermissionReporterWithSomeFieldsAndCustomRenderer()
+        permission = Permission.objects.get(codename='add_permission')
+
+        renderers = reporter.get_column_renderers()
+
+        self.assertEqual(len(renderers), 2)
+        self.assertEqual(renderers[1], reporter.get_codename_column)
+        self.assertEqual(
+            [render(permission) for render in renderers],
+            [u'Can add permission', u'Add permission']
+        )
+
+    def test_get_row_batches(self):
+        reporter = ChunkedUserReporter()
+        for i in range(3):
+            get_user_model().objects.create(username='foo%s' % i)
+
+        batches = reporter.get_row_batches(batch_size=2, raw=True)
+
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+        self.assertEqual(sum(reporter.get_row_batches(batch_size=2), []),
+                         list(reporter.get_rows()))
+
+    def test_column_batch_renderers(self):
+        self._create_users(_quantity=3)
+        group = Group.objects.create(name='Stark')
+        get_user_model().objects.get(username='foo1').groups.add(group)
+        reporter = BatchUserReporter()
+
+        rows = list(reporter.get_rows())
+
+        self.assertEqual(rows, [
+            [u'foo1', u'1 at example.com', u'Stark'],
+            [u'foo2', u'2 at example.com', u''],
+            [u'foo3', u'3 at example.com', u''],
+        ])
+        self.assertEqual(reporter.batches, [2, 1])
+        # single rows are rendered with a batch of one value
+        user = get_user_model().objects.get(username='foo2')
+        self.assertEqual(reporter.get_row(user)['email'], u'2 at example.com')
+
+    def test_column_batch_renderers_with_values_list(self):
+        reporter = BatchPermissionReporter(
+            Permission.objects.filter(codename='add_permission'))
+
+        self.assertTrue(reporter._can_use_values_list())
+        self.assertEqual(list(reporter.get_rows()), [[u'#1', u'add_permission']])
+        self.assertEqual(list(reporter.get_raw_rows()), [[u'#1', u'add_permission']])
+
+    def test_column_batch_renderer_with_wrong_length(self):
+        self._create_users(_quantity=2)
+        reporter = BatchUserReporter()
+        reporter.get_email_column_batch = lambda values: values[:1]
+
+        self.assertRaises(ValueError, list, reporter.get_rows())
+
+    def test_render_cache(self):
+        group1 = Group.objects.create(name='Night watch')
+        group2 = Group.objects.create(name='Stark')
+        for i, groups in enumerate([(group1, group2), (group2, group1), (group1,)]):
+            user = get_user_model().objects.create(username='foo%s' % i, last_name='Snow')
+            user.groups.add(*groups)
+        uncached = CachedUserReporter()
+        uncached.render_cache = None
+        reporter = CachedUserReporter()
+
+        rows = list(reporter.get_rows())
+
+        self.assertEqual(rows, list(uncached.get_rows()))
+        self.assertEqual(rows[2], [u'foo2', u'Night watch', u'SNOW'])
+        # the same set of groups is rendered once, and so is the custom column
+        self.assertEqual(reporter.render_cache.hits, 3)
+        self.assertEqual(reporter.render_cache.misses, 3)
+
+    def test_column_renderers_are_refreshed(self):
+        reporter = PermissionReporterWithFieldsNotInTheModel(
+            Permission.objects.filter(codename='add_permission'))
+        permission = reporter.items.get()
+
+        self.assertRaises(UndefinedField, reporter.get_row, permission)
+
+        reporter.get_foo_column = lambda x: 'id-%s' % x.id
+        self.assertEqual([row for row in reporter.get_rows()],
+                         [['Can add permission', 'add_permission', 'id-1']])
+
+        reporter.visible_fields = ('foo',)
+        self.assertEqual(reporter.get_row(permission), {'foo': 'id-1'})
+
+    def test_overridden_get_row(self):
+        class UpperPermissionReporter(PermissionReporterWithValuesList):
+            def get_row(self, instance):
+                row = super(UpperPermissionReporter, self).get_row(instance)
+                row['name'] = row['name'].upper()
+                return row
+
+        reporter = UpperPermissionReporter(
+            Permission.objects.filter(codename='add_permission'),
+            visible_fields=('name',))
+
+        self.assertEqual(list(reporter.get_rows()), [[u'CAN ADD PERMISSION']])
+
+    def test_overridden_get_row_fetches_every_field(self):
+        class EmailUserReporter(ModelReporter):
+            class Meta:
+                model = get_user_model()
+                fields = ('username',)
+
+            def get_row(self, instance):
+                row = super(EmailUserReporter, self).get_row(instance)
+                row['username'] = u'%s <%s>' % (row['username'], instance.email)
+                return row
+
+        self._create_users()
+        reporter = EmailUserReporter()
+
+        self.assertIsNone(reporter.get_required_fields())
+        with self.assertNumQueries(1):
+            rows = list(reporter.get_rows())
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0], [u'foo1 <1@example.com>'])
+
+    def test_overridden_field_handler(self):
+        class UpperPermissionReporter(PermissionReporterWithSomeFields):
+            def _render_field(self, instance, name):
+                value = super(UpperPermissionReporter, self)._render_field(instance, name)
+                return value.upper()
+
+        reporter = UpperPermissionReporter(
+            Permission.objects.filter(codename='add_permission'))
+
+        self.assertEqual([row for row in reporter.get_rows()],
+                         [[u'CAN ADD PERMISSION', u'ADD_PERMISSION']])
+
+    def test_empty_queryset(self):
+        self._create_users(_quantity=2)
+        reporter = BaseUserReporter(get_user_model().objects.none())
+
+        self.assertEqual([row for row in reporter.get_rows()], [])
+
+    def test_raw_rows(self):
+        get_user_model().objects.create(username='foo', is_staff=True,
+                                        date_joined=datetime.datetime(2014, 6, 1))
+        reporter = BaseUserReporter(
+            visible_fields=('id', 'username', 'is_staff', 'last_login', 'date_joined'))
+
+        rows = [row for row in reporter.get_raw_rows()]
+
+        self.assertEqual(rows, [
+            [rows[0][0], u'foo', True, rows[0][3], datetime.datetime(2014, 6, 1)]
+        ])
+        self.assertIsInstance(rows[0][0], (int, long))
+
+        reporter._meta.use_values_list = True
+        try:
+            self.assertEqual([row for row in reporter.get_raw_rows()], rows)
+        finally:
+            reporter._meta.use_values_list = False
+
+    def _create_groups(self):
+        permissions = Permission.objects.filter(
+            content_type=ContentType.objects.get_for_model(Permission))
+        Group.objects.create(name='foo').permissions.add(*permissions)
+        Group.objects.create(name='bar').permissions.add(permissions[0])
+        Group.objects.create(name='baz')
+
+    def test_annotations(self):
+        self._create_groups()
+        reporter = GroupReporterWithAnnotations(Group.objects.order_by('name'))
+
+        self.assertEqual(reporter.field_kinds['permission_count'], ANNOTATION)
+        self.assertEqual(reporter.get_header_row(),
+                         ['Name', 'Permission count', 'Upper name'])
+        with self.assertNumQueries(1):
+            rows = [row for row in reporter.get_rows()]
+
+        self.assertEqual(rows, [
+            [u'bar', u'1', u'BAR'], [u'baz', u'0', u'BAZ'], [u'foo', u'3', u'FOO'],
+        ])
+
+    def test_annotations_with_values_list_and_chunks(self):
+        self._create_groups()
+        reporter = GroupReporterWithAnnotations()
+        reporter.chunk_size = 2
+        reporter._meta.use_values_list = True
+
+        try:
+            self.assertTrue(reporter._can_use_values_list())
+            rows = [row for row in reporter.get_rows()]
+        finally:
+            reporter._meta.use_values_list = False
+
+        self.assertEqual(rows, [
+            [u'foo', u'3', u'FOO'], [u'bar', u'1', u'BAR'], [u'baz', u'0', u'BAZ'],
+        ])
+
+    def test_hidden_annotations_are_not_computed(self):
+        reporter = GroupReporterWithAnnotations(visible_fields=('name',))
+
+        self.assertNotIn('UPPER', str(reporter.get_items().query))
+        self.assertNotIn('COUNT', str(reporter.get_items().query))
+
     def test_reporter_with_hidden_fields(self):
         self._create_users()
         reporter = BaseUserReporter(visible_fields=('first_name', 'last_name'))
@@ -420,3 +1140,1293 @@ class BaseCSVGeneratorViewTestCase(TestCase):
         self.assertFalse(writer_mock.return_value.writerow.called)
         writer_mock.return_value.writerows.assert_called_once_with(
             reporter_mock.get_rows())
+
+    def test_write_csv_closes_writer(self):
+        view = BaseCSVGeneratorView()
+        view.writer_class = BufferedUnicodeWriter
+        view.reporter_class = PermissionReporterWithSomeFields
+        view.queryset = Permission.objects.filter(codename='add_permission')
+        fh = io.BytesIO()
+
+        view.write_csv(fh)
+
+        self.assertEqual(fh.getvalue(),
+            'Name,Codename\r\nCan add permission,add_permission\r\n')
+
+    def test_stream_csv_with_buffered_writer(self):
+        view = BaseCSVGeneratorView()
+        view.writer_class = BufferedUnicodeWriter
+        view.reporter_class = PermissionReporterWithSomeFields
+        view.queryset = Permission.objects.filter(
+            content_type=ContentType.objects.get_for_model(Permission))
+        view.stream_batch_size = 2
+
+        fh = io.BytesIO()
+        view.write_csv(fh)
+
+        chunks = list(view.stream_csv())
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(chunks[0], 'Name,Codename\r\n')
+        self.assertEqual(''.join(chunks), fh.getvalue())
+
+    def test_should_stream(self):
+        view = BaseCSVGeneratorView()
+        self.assertFalse(view.should_stream())
+
+        view.streaming = True
+        self.assertTrue(view.should_stream())
+
+    def test_get_should_stream_csv(self):
+        view = BaseCSVGeneratorView()
+        view.streaming = True
+        view.stream_csv = Mock(return_value=iter(['foo']))
+        request = RequestFactory().get('/')
+
+        response = view.get(request)
+
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(
+            response['Content-Disposition'],
+            'attachment; filename="myreport.csv"'
+        )
+        self.assertEqual(list(response.streaming_content), ['foo'])
+
+    def test_stream_csv_in_batches(self):
+        view = BaseCSVGeneratorView()
+        view.reporter_class = PermissionReporterWithSomeFields
+        view.queryset = Permission.objects.filter(
+            content_type=ContentType.objects.get_for_model(Permission))
+        view.stream_batch_size = 2
+
+        chunks = list(view.stream_csv())
+
+        self.assertEqual(chunks, [
+            'Name,Codename\r\n',
+            'Can add permission,add_permission\r\n'
+            'Can change permission,change_permission\r\n',
+            'Can delete permission,delete_permission\r\n',
+        ])
+
+    def test_streamed_and_buffered_outputs_match(self):
+        view = BaseCSVGeneratorView()
+        view.reporter_class = PermissionReporterWithAllFields
+        view.queryset = Permission.objects.all()
+        request = RequestFactory().get('/')
+
+        buffered = view.get(request).content
+        view.streaming = True
+        streamed = ''.join(view.get(request).streaming_content)
+
+        self.assertEqual(streamed, buffered)
+
+    def _get_compressed_view(self):
+        view = BaseCSVGeneratorView()
+        view.reporter_class = PermissionReporterWithAllFields
+        view.queryset = Permission.objects.all()
+        view.compress = True
+        return view
+
+    def test_get_content_encoding(self):
+        view = BaseCSVGeneratorView()
+        factory = RequestFactory()
+        request = factory.get('/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertIsNone(view.get_content_encoding(request))
+
+        view.compress = True
+        self.assertEqual(view.get_content_encoding(request), 'gzip')
+        self.assertEqual(view.get_content_encoding(
+            factory.get('/', HTTP_ACCEPT_ENCODING='deflate, gzip;q=0')), 'deflate')
+        self.assertEqual(view.get_content_encoding(
+            factory.get('/', HTTP_ACCEPT_ENCODING='br;q=1.0, GZIP;q=0.5')), 'gzip')
+        self.assertIsNone(view.get_content_encoding(
+            factory.get('/', HTTP_ACCEPT_ENCODING='identity')))
+        self.assertIsNone(view.get_content_encoding(factory.get('/')))
+
+    def test_compressed_responses(self):
+        view = self._get_compressed_view()
+        plain = view.get(RequestFactory().get('/')).content
+
+        for streaming in (False, True):
+            view.streaming = streaming
+            for encoding, wbits in (('gzip', 16 + zlib.MAX_WBITS),
+                                    ('deflate', zlib.MAX_WBITS)):
+                request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=encoding)
+                response = view.get(request)
+                if streaming:
+                    content = ''.join(response.streaming_content)
+                else:
+                    content = response.content
+
+                self.assertEqual(response['Content-Encoding'], encoding)
+                self.assertEqual(response['Vary'], 'Accept-Encoding')
+                self.assertEqual(response['Content-Type'], 'text/csv')
+                self.assertEqual(zlib.decompress(content, wbits), plain)
+
+    def test_uncompressed_response_varies_on_encoding(self):
+        view = self._get_compressed_view()
+
+        response = view.get(RequestFactory().get('/'))
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_gzip_attachment(self):
+        view = self._get_compressed_view()
+        view.compress = False
+        plain = view.get(RequestFactory().get('/'))
+
+        view.gzip_attachment = True
+        response = view.get(RequestFactory().get('/'))
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename="myreport.csv.gz"')
+        self.assertEqual(
+            gzip.GzipFile(fileobj=io.BytesIO(response.content)).read(),
+            plain.content)
+
+
+class UtilsTestCase(TestCase):
+
+    def test_lru_cache(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)  # discards 'b', the least recently used
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get_stats(), {
+            'hits': 2, 'misses': 1, 'hit_rate': 2 / 3.0, 'size': 2, 'max_size': 2})
+
+    def _write(self, writer_class, rows, **kwargs):
+        fh = io.BytesIO()
+        writer = writer_class(fh, **kwargs)
+        writer.writerow([u'Name', u'Value'])
+        writer.writerows(rows)
+        if hasattr(writer, 'close'):
+            writer.close()
+        return fh.getvalue()
+
+    def test_buffered_writer_matches_unicode_writer(self):
+        rows = [[u'caf\xe9', u'1'], [u'Ol\xe9, "quoted"', u''], [u'a\nb', u'3']]
+
+        for encoding in ('utf-8', 'utf-16', 'latin-1'):
+            self.assertEqual(
+                self._write(BufferedUnicodeWriter, rows, encoding=encoding,
+                            batch_size=2),
+                self._write(UnicodeWriter, rows, encoding=encoding)
+            )
+
+    def test_buffered_writer_batches(self):
+        fh = Mock()
+        writer = BufferedUnicodeWriter(fh, batch_size=2)
+
+        writer.writerow([u'a'])
+        self.assertFalse(fh.write.called)
+
+        writer.writerow([u'b'])
+        fh.write.assert_called_once_with('a\r\nb\r\n')
+
+        writer.writerows([[u'c']] * 5)
+        self.assertEqual(fh.write.call_count, 4)
+
+        writer.close()
+        self.assertEqual(fh.write.call_count, 4)
+
+    def test_buffered_writer_non_unicode_values(self):
+        self.assertEqual(
+            self._write(BufferedUnicodeWriter, [[1, None, 'foo']]),
+            'Name,Value\r\n1,,foo\r\n'
+        )
+
+    def test_compressed_stream(self):
+        fh = io.BytesIO()
+        stream = CompressedStream(fh)
+        for i in range(1000):
+            stream.write('foo,bar\r\n')
+        stream.close()
+
+        self.assertLess(len(fh.getvalue()), 100)
+        self.assertEqual(gzip.GzipFile(fileobj=io.BytesIO(fh.getvalue())).read(),
+                         'foo,bar\r\n' * 1000)
+
+    def test_compress_chunks(self):
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunks = compress_chunks(iter(['foo\r\n', 'bar\r\n']))
+
+        # every chunk can be decompressed as soon as it's received
+        self.assertEqual(decompressor.decompress(next(chunks)), 'foo\r\n')
+        self.assertEqual(decompressor.decompress(next(chunks)), 'bar\r\n')
+        self.assertEqual(decompressor.decompress(''.join(chunks)), '')
+
+    def test_batched(self):
+        self.assertEqual(list(batched(range(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(batched([], 2)), [])
+
+
+class ParallelExportTestCase(TestCase):
+
+    def setUp(self):
+        for i in range(1, 8):
+            get_user_model().objects.create(username='foo%s' % i,
+                                            last_name='Bloggs %s' % i)
+
+    def _expected_output(self, reporter):
+        fh = io.BytesIO()
+        writer = UnicodeWriter(fh)
+        writer.writerow(reporter.get_header_row())
+        writer.writerows(reporter.get_rows())
+        return fh.getvalue()
+
+    def test_get_shards(self):
+        pks = get_user_model().objects.values_list('pk', flat=True)
+        first = min(pks)
+
+        self.assertEqual(
+            get_shards(get_user_model().objects.all(), 3),
+            [(first, first + 3), (first + 3, first + 6), (first + 6, first + 7)]
+        )
+        self.assertEqual(get_shards(get_user_model().objects.none(), 3), [])
+
+    def test_export_in_process(self):
+        reporter = ChunkedUserReporter(
+            get_user_model().objects.exclude(username='foo2'))
+        fh = io.BytesIO()
+
+        export_parallel(reporter, fh, workers=1, shard_size=3)
+
+        self.assertEqual(fh.getvalue(), self._expected_output(reporter))
+        self.assertNotIn('foo2', fh.getvalue())
+
+    def test_export_with_worker_processes(self):
+        reporter = ChunkedUserReporter(visible_fields=('username',))
+        fh = io.BytesIO()
+
+        export_parallel(reporter, fh, workers=2, shard_size=2,
+                        write_header=False)
+
+        self.assertEqual(
+            fh.getvalue(),
+            ''.join('foo%s\r\n' % i for i in range(1, 8))
+        )
+
+    def test_worker_connections(self):
+        connection = Mock(vendor='postgresql', settings_dict={'NAME': 'reports'})
+
+        with patch('reportato.parallel.connections') as connections:
+            connections.all.return_value = [connection]
+            # workers drop the inherited connection without closing it
+            _drop_connections()
+            self.assertIsNone(connection.connection)
+            self.assertFalse(connection.close.called)
+
+            _close_connections()
+            connection.close.assert_called_once_with()
+
+    def test_export_needs_a_queryset(self):
+        reporter = ChunkedUserReporter(list(get_user_model().objects.all()))
+
+        self.assertRaises(ValueError, export_parallel, reporter, io.BytesIO())
+
+
+class BatchExportTestCase(TestCase):
+
+    def setUp(self):
+        permissions = Permission.objects.order_by('pk')
+        for i in range(5):
+            group = Group.objects.create(name='group%s' % i)
+            group.permissions.add(*permissions[:i])
+
+    def _export(self, reporter):
+        fh = io.BytesIO()
+        writer = UnicodeWriter(fh)
+        writer.writerow(reporter.get_header_row())
+        writer.writerows(reporter.get_rows())
+        return fh.getvalue()
+
+    def test_export_batch(self):
+        queryset = Group.objects.filter(name__startswith='group')
+        reporters = [
+            GroupReporterWithRelationHints(queryset),
+            GroupReporter(queryset, visible_fields=('name',)),
+            GroupReporterWithAnnotations(queryset),
+            GroupReporterWithAnnotations(queryset, visible_fields=('permission_count',)),
+        ]
+        files = [io.BytesIO() for reporter in reporters]
+
+        # a query per chunk, plus the ones prefetching its permissions and
+        # their content types
+        with self.assertNumQueries(9):
+            count = export_batch(zip(reporters, files), chunk_size=2)
+
+        self.assertEqual(count, 5)
+        for reporter, fh in zip(reporters, files):
+            self.assertEqual(fh.getvalue(), self._export(reporter))
+
+    def test_batch_queryset_only_has_required_fields(self):
+        queryset = get_user_model().objects.all()
+        reporters = [BaseUserReporter(queryset, visible_fields=('username',)),
+                     ChunkedUserReporter(queryset)]
+
+        deferred_names, defer = get_batch_queryset(reporters).query.deferred_loading
+        self.assertEqual((set(deferred_names), defer),
+                         (set(['id', 'username', 'last_name']), False))
+
+        # custom columns without `requires` can read any field
+        class FullNameUserReporter(BaseUserReporter):
+            def get_username_column(self, instance):
+                return instance.get_full_name()
+
+        reporters.append(FullNameUserReporter(queryset, visible_fields=('username',)))
+        deferred_names, defer = get_batch_queryset(reporters).query.deferred_loading
+        self.assertEqual((deferred_names, defer), (set(), True))
+
+    def test_reporters_need_the_same_queryset(self):
+        reporters = [GroupReporter(Group.objects.filter(name='group1')),
+                     GroupReporter(Group.objects.filter(name='group2'))]
+        self.assertRaises(ValueError, export_batch,
+                          [(reporter, io.BytesIO()) for reporter in reporters])
+
+    def test_sliced_batch_prefetches_relations(self):
+        queryset = Group.objects.filter(name__startswith='group').order_by('pk')[:5]
+        reporters = [GroupReporterWithRelationHints(queryset),
+                     GroupReporter(queryset, visible_fields=('name',))]
+        files = [io.BytesIO() for reporter in reporters]
+
+        # the groups, and the permissions and their content types of every chunk
+        with self.assertNumQueries(5):
+            count = export_batch(zip(reporters, files), chunk_size=3)
+
+        self.assertEqual(count, 5)
+        for reporter, fh in zip(reporters, files):
+            self.assertEqual(fh.getvalue(), self._export(reporter))
+
+    def test_batch_with_overridden_get_row(self):
+        class UpperGroupReporter(GroupReporter):
+            def get_row(self, instance):
+                row = super(UpperGroupReporter, self).get_row(instance)
+                row['name'] = row['name'].upper()
+                return row
+
+        queryset = Group.objects.filter(name__startswith='group')
+        reporter = UpperGroupReporter(queryset, visible_fields=('name',))
+        fh = io.BytesIO()
+
+        export_batch([(reporter, fh), (GroupReporter(queryset), io.BytesIO())])
+
+        self.assertEqual(fh.getvalue(), self._export(reporter))
+        self.assertIn('GROUP1', fh.getvalue())
+
+    def test_batch_instruments(self):
+        queryset = Group.objects.filter(name__startswith='group')
+        callback = Mock()
+        reporters = [GroupReporter(queryset), GroupReporter(queryset, visible_fields=('name',))]
+        for reporter in reporters:
+            reporter.instrument = ReportInstrument(callbacks=[callback])
+
+        export_batch([(reporter, io.BytesIO()) for reporter in reporters], chunk_size=2)
+
+        self.assertEqual(callback.call_count, 2)
+        for reporter in reporters:
+            metrics = reporter.instrument.metrics
+            self.assertIsNone(reporter.instrument.started)
+            self.assertEqual(metrics.rows, 5)
+            self.assertTrue(metrics.bytes)
+            self.assertEqual(sorted(metrics.column_times), sorted(reporter.visible_fields))
+            self.assertEqual(metrics.column_times['name'][1], 5)
+
+    def test_failed_batch_stops_instruments(self):
+        class FailingGroupReporter(GroupReporter):
+            def get_name_column(self, instance):
+                raise ValueError
+
+        callback = Mock()
+        reporter = FailingGroupReporter(Group.objects.filter(name__startswith='group'))
+        reporter.instrument = ReportInstrument(callbacks=[callback])
+
+        self.assertRaises(ValueError, export_batch, [(reporter, io.BytesIO())])
+        self.assertIsNone(reporter.instrument.started)
+        self.assertFalse(callback.called)
+
+    def test_clashing_annotations(self):
+        class OtherGroupReporter(ModelReporter):
+            class Meta:
+                model = Group
+                fields = ('upper_name',)
+                annotations = {'upper_name': 'LOWER("auth_group"."name")'}
+
+        reporters = [GroupReporterWithAnnotations(), OtherGroupReporter()]
+        self.assertRaises(ValueError, export_batch,
+                          [(reporter, io.BytesIO()) for reporter in reporters])
+
+
+class PermissionBackgroundReportView(BackgroundReportMixin, BaseCSVGeneratorView):
+    reporter_class = PermissionReporterWithSomeFields
+
+    def get_report_filters(self):
+        return {'codename': self.request.GET['codename']}
+
+
+class MultilinePermissionReporter(ModelReporter):
+    class Meta:
+        model = Permission
+        fields = ('name', 'codename')
+
+    def get_name_column(self, instance):
+        return instance.name.replace(' ', '\n')
+
+
+class MultilinePermissionBackgroundReportView(BackgroundReportMixin, BaseCSVGeneratorView):
+    reporter_class = MultilinePermissionReporter
+
+    def get_report_filters(self):
+        return {'content_type': ContentType.objects.get_for_model(Permission).pk}
+
+
+class ReportJobsTestCase(TestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.storage = FileSystemReportStorage(self.location)
+        self.jobs = ReportJobManager(SynchronousJobBackend(), self.storage)
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def test_report_key(self):
+        key = get_report_key(PermissionReporterWithSomeFields, {'a': 1, 'b': 2})
+
+        self.assertEqual(key, get_report_key(
+            PermissionReporterWithSomeFields, {'b': 2, 'a': 1},
+            ('name', 'codename')))
+        self.assertNotEqual(key, get_report_key(
+            PermissionReporterWithSomeFields, {'a': 1}))
+        self.assertNotEqual(key, get_report_key(
+            PermissionReporterWithSomeFields, {'a': 1, 'b': 2}, ('name',)))
+        self.assertNotEqual(key, get_report_key(
+            PermissionReporterWithAllFields, {'a': 1, 'b': 2}))
+
+    @patch('reportato.utils._UMASK', 022)
+    def test_storage_file_permissions(self):
+        self.storage.save('key', lambda fh: fh.write('foo'))
+        self.storage.save_index('key', [0])
+
+        for path in (self.storage.path('key'), self.storage.index_path('key')):
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0644)
+
+    def test_storage_save_is_atomic(self):
+        def write(fh):
+            fh.write('foo')
+            raise ValueError
+
+        self.assertRaises(ValueError, self.storage.save, 'key', write)
+        self.assertFalse(self.storage.exists('key'))
+        self.assertEqual(os.listdir(self.location), [])
+
+        self.storage.save('key', lambda fh: fh.write('foo'))
+        self.assertEqual(self.storage.open('key').read(), 'foo')
+
+        self.storage.delete('key')
+        self.assertFalse(self.storage.exists('key'))
+
+    def test_request_generates_report(self):
+        filters = {'codename': 'add_permission'}
+
+        status = self.jobs.request(PermissionReporterWithSomeFields, filters)
+
+        self.assertEqual(status, READY)
+        self.assertEqual(
+            self.jobs.open(PermissionReporterWithSomeFields, filters).read(),
+            'Name,Codename\r\nCan add permission,add_permission\r\n'
+        )
+
+    def test_reports_are_served_until_invalidated(self):
+        self.jobs.generate = Mock(side_effect=self.jobs.generate)
+        self.jobs.request(PermissionReporterWithSomeFields)
+        self.jobs.request(PermissionReporterWithSomeFields)
+        self.assertEqual(self.jobs.generate.call_count, 1)
+
+        self.jobs.invalidate(PermissionReporterWithSomeFields)
+        self.jobs.request(PermissionReporterWithSomeFields)
+        self.assertEqual(self.jobs.generate.call_count, 2)
+
+    def test_stale_reports_are_generated_again(self):
+        self.jobs.max_age = 60
+        self.jobs.request(PermissionReporterWithSomeFields)
+        key = get_report_key(PermissionReporterWithSomeFields)
+        self.assertTrue(self.jobs.is_fresh(key))
+
+        old = time.time() - 120
+        os.utime(self.storage.path(key), (old, old))
+        self.assertFalse(self.jobs.is_fresh(key))
+
+    def test_thread_pool_backend(self):
+        backend = ThreadPoolJobBackend(workers=1)
+        started, finish = threading.Event(), threading.Event()
+
+        def job(value):
+            started.set()
+            finish.wait()
+            calls.append(value)
+
+        calls = []
+        result = backend.submit('key', job, 1)
+        started.wait()
+        self.assertTrue(backend.is_pending('key'))
+        # jobs with the same key aren't enqueued twice
+        self.assertIs(backend.submit('key', job, 2), result)
+
+        finish.set()
+        result.wait()
+        self.assertEqual(calls, [1])
+        self.assertFalse(backend.is_pending('key'))
+
+    def test_background_report_view(self):
+        jobs = ReportJobManager(Mock(), self.storage)
+        view = PermissionBackgroundReportView.as_view(report_jobs=jobs)
+        request = RequestFactory().get('/', {'codename': 'add_permission'})
+
+        jobs.backend.is_pending.return_value = False
+        response = view(request)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.content, PENDING)
+        self.assertEqual(jobs.backend.submit.call_count, 1)
+
+        jobs.backend.is_pending.return_value = True
+        self.assertEqual(view(request).status_code, 202)
+        self.assertEqual(jobs.backend.submit.call_count, 1)
+
+        jobs.generate(*jobs.backend.submit.call_args[0][2:])
+        response = view(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            ''.join(response.streaming_content),
+            'Name,Codename\r\nCan add permission,add_permission\r\n'
+        )
+
+
+    def _generate_indexed_report(self):
+        self.jobs.index_interval = 2
+        self.jobs.writer_class = BufferedUnicodeWriter
+        filters = {'content_type': ContentType.objects.get_for_model(Permission).pk}
+        self.jobs.request(MultilinePermissionReporter, filters)
+        return filters
+
+    def test_row_index(self):
+        filters = self._generate_indexed_report()
+        index = self.jobs.get_index(MultilinePermissionReporter, filters)
+        fh = self.jobs.open(MultilinePermissionReporter, filters)
+        content = fh.read()
+        header = 'Name,Codename\r\n'
+        rows = [
+            '"Can\nadd\npermission",add_permission\r\n',
+            '"Can\nchange\npermission",change_permission\r\n',
+            '"Can\ndelete\npermission",delete_permission\r\n',
+        ]
+        self.assertEqual(content, header + ''.join(rows))
+        self.assertEqual(index['rows'], 3)
+        self.assertEqual(index['offsets'], [len(header), len(header + rows[0] + rows[1])])
+
+        for first, last in ((0, 0), (1, 2), (1, 1), (2, 10), (0, 2)):
+            start, end = get_row_range(fh, index, first, last)
+            self.assertEqual(content[start:end], ''.join(rows[first:last + 1]))
+        self.assertRaises(ValueError, get_row_range, fh, index, 3, 4)
+        self.assertRaises(ValueError, get_row_range, fh, index, 2, 1)
+
+    def test_stale_row_index(self):
+        filters = self._generate_indexed_report()
+        key = get_report_key(MultilinePermissionReporter, filters)
+        self.storage.save(key, lambda fh: fh.write('foo'))
+
+        self.assertIsNone(self.jobs.get_index(MultilinePermissionReporter, filters))
+
+    def test_view_ranges(self):
+        filters = self._generate_indexed_report()
+        content = self.jobs.open(MultilinePermissionReporter, filters).read()
+        etag = self.jobs.get_etag(MultilinePermissionReporter, filters)
+        view = MultilinePermissionBackgroundReportView.as_view(report_jobs=self.jobs)
+        factory = RequestFactory()
+
+        response = view(factory.get('/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(''.join(response.streaming_content), content)
+
+        response = view(factory.get('/', HTTP_RANGE='bytes=20-', HTTP_IF_RANGE=etag))
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'],
+                         'bytes 20-%d/%d' % (len(content) - 1, len(content)))
+        self.assertEqual(''.join(response.streaming_content), content[20:])
+
+        response = view(factory.get('/', HTTP_RANGE='bytes=-10'))
+        self.assertEqual(''.join(response.streaming_content), content[-10:])
+
+        response = view(factory.get('/', HTTP_RANGE='bytes=5-9', HTTP_IF_RANGE='"old"'))
+        self.assertEqual(response.status_code, 200)
+
+        response = view(factory.get('/', HTTP_RANGE='bytes=%d-' % len(content)))
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */%d' % len(content))
+
+    def test_open_report_is_consistent(self):
+        filters = self._generate_indexed_report()
+        fh, size, etag = self.jobs.open_report(MultilinePermissionReporter, filters)
+        self.assertEqual(etag, self.jobs.get_etag(MultilinePermissionReporter, filters))
+
+        # the report is generated again while the old one is being served
+        key = get_report_key(MultilinePermissionReporter, filters)
+        self.storage.save(key, lambda new: new.write('new report\r\n'))
+
+        content = fh.read()
+        fh.close()
+        self.assertEqual(len(content), size)
+        self.assertNotEqual(size, self.jobs.get_size(MultilinePermissionReporter, filters))
+        self.assertNotEqual(etag, self.jobs.get_etag(MultilinePermissionReporter, filters))
+
+    def test_view_row_ranges(self):
+        self._generate_indexed_report()
+        view = MultilinePermissionBackgroundReportView.as_view(report_jobs=self.jobs)
+        factory = RequestFactory()
+
+        response = view(factory.get('/', {'rows': '1-1'}))
+        self.assertEqual(
+            ''.join(response.streaming_content),
+            'Name,Codename\r\n"Can\nchange\npermission",change_permission\r\n')
+        response = view(factory.get('/', {'rows': '2-'}))
+        self.assertEqual(
+            ''.join(response.streaming_content),
+            'Name,Codename\r\n"Can\ndelete\npermission",delete_permission\r\n')
+
+        for rows in ('foo', '3-4', '-1'):
+            self.assertEqual(view(factory.get('/', {'rows': rows})).status_code, 400)
+
+
+class CachedPermissionView(CachedReportMixin, BaseCSVGeneratorView):
+    reporter_class = PermissionReporterWithSomeFields
+
+    def get_queryset(self):
+        return Permission.objects.filter(codename__startswith=self.request.GET['prefix'])
+
+
+class ReportCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.report_cache = FileSystemReportCache(self.location)
+
+    def tearDown(self):
+        self.report_cache.unwatch_reporter(PermissionReporterWithSomeFields)
+        shutil.rmtree(self.location)
+
+    def _get(self, view_class=CachedPermissionView, prefix='add_', **kwargs):
+        request = RequestFactory().get('/', {'prefix': prefix}, **kwargs)
+        response = view_class.as_view(report_cache=self.report_cache)(request)
+        if response.streaming:
+            return response, b''.join(response.streaming_content)
+        return response, response.content
+
+    def test_queryset_fingerprint(self):
+        fingerprint = get_queryset_fingerprint(Permission.objects.filter(codename='a'))
+
+        self.assertEqual(fingerprint, get_queryset_fingerprint(
+            Permission.objects.filter(codename='a')))
+        self.assertNotEqual(fingerprint, get_queryset_fingerprint(
+            Permission.objects.filter(codename='b')))
+        self.assertNotEqual(fingerprint, get_queryset_fingerprint(
+            Permission.objects.filter(codename='a').order_by('name')))
+        self.assertTrue(get_queryset_fingerprint(Permission.objects.none()))
+
+    def test_cached_view(self):
+        response, content = self._get()
+        self.assertIn('add_permission', content)
+
+        with self.assertNumQueries(0):
+            cached, cached_content = self._get()
+        self.assertEqual(cached_content, content)
+        self.assertEqual(cached['Content-Disposition'], response['Content-Disposition'])
+        self.assertEqual(cached['Content-Type'], response['Content-Type'])
+        self.assertEqual(int(cached['Content-Length']), len(content))
+
+        # other filters are a different report
+        with self.assertNumQueries(1):
+            _, other = self._get(prefix='delete_')
+        self.assertIn('delete_permission', other)
+
+    def test_cached_view_is_invalidated(self):
+        _, content = self._get()
+
+        permission = Permission.objects.get(codename='add_permission')
+        permission.name = 'Can add permissions'
+        permission.save()
+
+        with self.assertNumQueries(1):
+            _, changed = self._get()
+        self.assertNotEqual(changed, content)
+        self.assertIn('Can add permissions', changed)
+
+        permission.delete()
+        _, deleted = self._get()
+        self.assertNotIn('add_permission', deleted)
+
+    def test_many_to_many_changes_invalidate_reports(self):
+        class UserGroupsReporter(ModelReporter):
+            class Meta:
+                model = get_user_model()
+                fields = ('username', 'groups')
+
+        class GroupUsersReporter(ModelReporter):
+            class Meta:
+                model = Group
+                fields = ('name', 'user')
+
+        through = get_user_model().groups.through
+        self.assertEqual(get_through_models(UserGroupsReporter), [through])
+        self.assertEqual(get_through_models(GroupUsersReporter), [through])
+
+        # the view class isn't used, but its reports are watched
+        class UserGroupsView(CachedReportMixin, BaseCSVGeneratorView):
+            reporter_class = UserGroupsReporter
+            report_cache = self.report_cache
+
+        try:
+            user = get_user_model().objects.create(username='bob')
+            group = Group.objects.create(name='admins')
+            generation = self.report_cache.get_generation(get_user_model())
+
+            user.groups.add(group)
+            self.assertNotEqual(self.report_cache.get_generation(get_user_model()),
+                                generation)
+        finally:
+            self.report_cache.unwatch_reporter(UserGroupsReporter)
+
+    def test_cached_streaming_view(self):
+        class StreamingView(CachedPermissionView):
+            streaming = True
+            compress = True
+
+        response, content = self._get(StreamingView, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+        with self.assertNumQueries(0):
+            cached, cached_content = self._get(StreamingView, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(cached_content, content)
+        self.assertEqual(cached['Content-Encoding'], 'gzip')
+        self.assertEqual(cached['Vary'], 'Accept-Encoding')
+
+        # other encodings are cached on their own
+        with self.assertNumQueries(1):
+            plain, plain_content = self._get(StreamingView)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(zlib.decompress(content, 16 + zlib.MAX_WBITS), plain_content)
+
+    def test_interrupted_stream_is_not_cached(self):
+        class StreamingView(CachedPermissionView):
+            streaming = True
+            stream_batch_size = 1
+
+        request = RequestFactory().get('/', {'prefix': 'add_'})
+        response = StreamingView.as_view(report_cache=self.report_cache)(request)
+        next(iter(response.streaming_content))
+        response.close()
+
+        self.assertEqual([name for name in os.listdir(self.location)
+                          if not name.endswith('.generation')], [])
+
+    def test_timeout(self):
+        self.report_cache.timeout = 60
+        self._get()
+
+        with patch('reportato.cache.time.time', return_value=time.time() + 61):
+            with self.assertNumQueries(1):
+                self._get()
+
+    def test_size_eviction(self):
+        self._get()
+        old_report = os.listdir(self.location)
+        old_report = [name for name in old_report if name.endswith('.report')][0]
+        # the first report was used a while ago
+        os.utime(os.path.join(self.location, old_report), (0, 0))
+        _, content = self._get(prefix='delete_')
+        self.report_cache.max_size = len(content)
+
+        self.report_cache.cull()
+
+        reports = [name for name in os.listdir(self.location) if name.endswith('.report')]
+        self.assertEqual(len(reports), 1)
+        self.assertNotEqual(reports[0], old_report)
+        self.assertEqual(len(os.listdir(self.location)), 2)
+
+        # reports bigger than max_size aren't stored
+        self.report_cache.max_size = 10
+        self._get(prefix='change_')
+        self.assertEqual(len(os.listdir(self.location)), 2)
+
+    def test_django_cache(self):
+        self.report_cache = DjangoReportCache(key_prefix='reportato-tests')
+        _, content = self._get()
+
+        with self.assertNumQueries(0):
+            _, cached = self._get()
+        self.assertEqual(cached, content)
+
+        Permission.objects.get(codename='add_permission').save()
+        with self.assertNumQueries(1):
+            self._get()
+
+        self.report_cache.max_entry_size = 10
+        with self.assertNumQueries(1):
+            self._get(prefix='delete_')
+        with self.assertNumQueries(1):
+            self._get(prefix='delete_')
+
+
+class FileExportTestCase(TestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.path = os.path.join(self.location, 'permissions.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def _read(self, path):
+        with open(path, 'rb') as fh:
+            return fh.read()
+
+    def test_export_to_file(self):
+        reporter = PermissionReporterWithSomeFields(
+            Permission.objects.filter(codename__startswith='add_'))
+
+        manifest = export_to_file(reporter, self.path, buffer_size=16)
+
+        content = self._read(self.path)
+        self.assertTrue(content.startswith('Name,Codename\r\n'))
+        self.assertIn('add_permission', content)
+        self.assertEqual(manifest['rows'], reporter.items.count())
+        self.assertEqual(manifest['bytes'], len(content))
+        self.assertEqual(manifest['sha256'], hashlib.sha256(content).hexdigest())
+        self.assertEqual(manifest['file'], 'permissions.csv')
+        self.assertGreaterEqual(manifest['duration'], 0)
+        with open(get_manifest_path(self.path)) as fh:
+            self.assertEqual(json.load(fh), manifest)
+        self.assertEqual(sorted(os.listdir(self.location)),
+                         ['permissions.csv', 'permissions.csv.manifest.json'])
+
+    @patch('reportato.utils._UMASK', 022)
+    def test_export_file_permissions(self):
+        export_to_file(PermissionReporterWithSomeFields(), self.path)
+
+        for path in (self.path, get_manifest_path(self.path)):
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0644)
+
+        # the permissions of the current file are kept
+        os.chmod(self.path, 0640)
+        export_to_file(PermissionReporterWithSomeFields(), self.path, keep=2)
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0640)
+
+    def test_failed_export_keeps_the_current_file(self):
+        export_to_file(PermissionReporterWithSomeFields(), self.path)
+        content = self._read(self.path)
+
+        reporter = PermissionReporterWithSomeFields()
+        reporter.get_rows = Mock(side_effect=RuntimeError)
+        self.assertRaises(RuntimeError, export_to_file, reporter, self.path)
+
+        self.assertEqual(self._read(self.path), content)
+        self.assertEqual(sorted(os.listdir(self.location)),
+                         ['permissions.csv', 'permissions.csv.manifest.json'])
+
+    def test_versions(self):
+        for codename in ('add_', 'change_', 'delete_', 'add_'):
+            export_to_file(PermissionReporterWithSomeFields(
+                Permission.objects.filter(codename__startswith=codename)),
+                self.path, keep=3)
+
+        self.assertEqual(sorted(os.listdir(self.location)), [
+            'permissions.csv', 'permissions.csv.1', 'permissions.csv.2',
+            'permissions.csv.manifest.json', 'permissions.csv.manifest.json.1',
+            'permissions.csv.manifest.json.2',
+        ])
+        self.assertIn('add_', self._read(self.path))
+        self.assertIn('delete_', self._read(get_version_path(self.path, 1)))
+        self.assertIn('change_', self._read(get_version_path(self.path, 2)))
+        with open(get_version_path(get_manifest_path(self.path), 1)) as fh:
+            manifest = json.load(fh)
+        self.assertEqual(manifest['sha256'], hashlib.sha256(
+            self._read(get_version_path(self.path, 1))).hexdigest())
+
+    def test_export_many(self):
+        permissions = list(Permission.objects.all())
+        exports = [(PermissionReporterWithSomeFields(permissions[:i]),
+                    os.path.join(self.location, '%s.csv' % i))
+                   for i in range(1, 6)]
+
+        manifests = export_many(exports, workers=2)
+
+        self.assertEqual([manifest['rows'] for manifest in manifests], [1, 2, 3, 4, 5])
+        for manifest, (_, path) in zip(manifests, exports):
+            self.assertEqual(manifest['sha256'], hashlib.sha256(self._read(path)).hexdigest())
+
+    def test_command(self):
+        stdout = io.BytesIO()
+        call_command('export_reports',
+                     'reportato.tests.PermissionReporterWithSomeFields', self.path,
+                     'reportato.tests.GroupReporter', self.path + '.groups',
+                     workers=1, keep=2, fields='name', stdout=stdout)
+
+        self.assertTrue(self._read(self.path).startswith('Name\r\n'))
+        self.assertIn('%s: %d rows' % (self.path, Permission.objects.count()),
+                      stdout.getvalue())
+
+        self.assertRaises(CommandError, call_command, 'export_reports', self.path)
+        self.assertRaises(CommandError, call_command, 'export_reports',
+                          'reportato.tests.Missing', self.path)
+
+
+class DeltaReportTestCase(TestCase):
+
+    def setUp(self):
+        self.now = datetime.datetime(2014, 6, 1, 12, 0)
+        for i in range(1, 4):
+            get_user_model().objects.create(
+                username='foo%s' % i, last_name='Bloggs %s' % i,
+                last_login=self.now)
+
+    def _update(self, username, **kwargs):
+        kwargs['last_login'] = self.now + datetime.timedelta(hours=1)
+        get_user_model().objects.filter(username=username).update(**kwargs)
+
+    def test_watermark(self):
+        reporter = IncrementalUserReporter()
+
+        self.assertEqual(reporter.get_watermark(), self.now)
+        self.assertEqual(
+            len([row for row in reporter.changed_since(self.now).get_rows()]), 0)
+        self.assertEqual(
+            len([row for row in reporter.changed_since(None).get_rows()]), 3)
+
+    def test_reporter_without_change_tracking_field(self):
+        self.assertRaises(ImproperlyConfigured,
+                          BaseUserReporter().changed_since, self.now)
+
+    def test_write_delta(self):
+        self._update('foo2', last_name='Snow')
+        fh = io.BytesIO()
+
+        watermark = write_delta(IncrementalUserReporter(), fh, since=self.now)
+
+        self.assertEqual(watermark, self.now + datetime.timedelta(hours=1))
+        self.assertEqual(fh.getvalue(), 'Id,Username,Last name\r\n2,foo2,Snow\r\n')
+
+    def test_write_delta_without_changes(self):
+        fh = io.BytesIO()
+
+        watermark = write_delta(IncrementalUserReporter(), fh, since=self.now)
+
+        self.assertEqual(watermark, self.now)
+        self.assertEqual(fh.getvalue(), 'Id,Username,Last name\r\n')
+
+    def test_merge_delta(self):
+        previous = io.BytesIO()
+        since = write_delta(IncrementalUserReporter(), previous)
+        previous.seek(0)
+
+        self._update('foo2', last_name=u'Snów')
+        get_user_model().objects.create(
+            username='foo4', last_name='Bloggs 4',
+            last_login=self.now + datetime.timedelta(hours=2))
+
+        fh = io.BytesIO()
+        watermark = merge_delta(IncrementalUserReporter(), previous, fh, since=since)
+
+        self.assertEqual(watermark, self.now + datetime.timedelta(hours=2))
+        self.assertEqual(fh.getvalue(), (
+            'Id,Username,Last name\r\n'
+            '1,foo1,Bloggs 1\r\n'
+            '2,foo2,Sn\xc3\xb3w\r\n'
+            '3,foo3,Bloggs 3\r\n'
+            '4,foo4,Bloggs 4\r\n'
+        ))
+
+
+class XLSXWriterTestCase(TestCase):
+
+    def _read(self, data, name='xl/worksheets/sheet1.xml'):
+        archive = zipfile.ZipFile(io.BytesIO(data))
+        self.assertIsNone(archive.testzip())
+        return archive.read(name)
+
+    def test_write_typed_cells(self):
+        fh = io.BytesIO()
+        writer = XLSXWriter(fh)
+        writer.writerow([u'Name', u'Value'])
+        writer.writerows([
+            [u'caf\xe9 & <bar> ', 1],
+            ['foo', Decimal('1.50')],
+            [None, True],
+            [datetime.date(1900, 3, 1), datetime.datetime(2014, 6, 1, 18)],
+        ])
+        writer.close()
+
+        sheet = self._read(fh.getvalue())
+        self.assertIn(
+            '<row><c t="inlineStr"><is><t>Name</t></is></c>'
+            '<c t="inlineStr"><is><t>Value</t></is></c></row>', sheet)
+        self.assertIn(
+            '<row><c t="inlineStr"><is><t xml:space="preserve">caf\xc3\xa9 &amp; &lt;bar&gt; </t></is></c>'
+            '<c><v>1</v></c></row>', sheet)
+        self.assertIn(
+            '<row><c t="inlineStr"><is><t>foo</t></is></c><c><v>1.50</v></c></row>', sheet)
+        self.assertIn('<row><c/><c t="b"><v>1</v></c></row>', sheet)
+        self.assertIn('<row><c s="1"><v>61</v></c><c s="2"><v>41791.75</v></c></row>', sheet)
+
+    def test_shared_strings(self):
+        fh = io.BytesIO()
+        writer = XLSXWriter(fh, shared_strings=True)
+        writer.writerows([[u'foo', u'bar'], [u'bar', 2]])
+        writer.close()
+
+        self.assertIn(
+            '<row><c t="s"><v>0</v></c><c t="s"><v>1</v></c></row>'
+            '<row><c t="s"><v>1</v></c><c><v>2</v></c></row>',
+            self._read(fh.getvalue()))
+        self.assertIn(
+            '<si><t xml:space="preserve">foo</t></si><si><t xml:space="preserve">bar</t></si>',
+            self._read(fh.getvalue(), 'xl/sharedStrings.xml'))
+
+    def test_xlsx_view(self):
+        view = BaseXLSXGeneratorView()
+        view.reporter_class = PermissionReporterWithAllFields
+        view.queryset = Permission.objects.filter(codename='add_permission')
+        request = RequestFactory().get('/')
+
+        response = view.get(request)
+        self.assertEqual(response['Content-Type'],
+            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        self.assertEqual(response['Content-Disposition'],
+            'attachment; filename="myreport.xlsx"')
+        sheet = self._read(response.content)
+        self.assertIn('<c><v>1</v></c><c t="inlineStr"><is><t>Can add permission</t></is></c>', sheet)
+
+        view.streaming = True
+        streamed = ''.join(view.get(request).streaming_content)
+        self.assertEqual(self._read(streamed), sheet)
+
+
+class TypedUserReporter(ModelReporter):
+    class Meta:
+        model = get_user_model()
+        fields = ('id', 'username', 'is_staff', 'date_joined', 'groups',
+                  'name_length', 'full_name')
+
+    @column_type('int64')
+    def get_name_length_column(self, instance):
+        return len(instance.username)
+
+    def get_full_name_column(self, instance):
+        return instance.get_full_name()
+
+
+@unittest.skipUnless(pyarrow, 'pyarrow is not installed')
+class ColumnarExportTestCase(TestCase):
+
+    def setUp(self):
+        group = Group.objects.create(name='Night watch')
+        for i in range(1, 4):
+            user = get_user_model().objects.create(
+                username='foo%s' % i, first_name=u'J\xf3n', last_name='Snow',
+                is_staff=i == 2, date_joined=datetime.datetime(2014, 6, i))
+            user.groups.add(group)
+
+    def test_column_types(self):
+        self.assertEqual(get_column_types(TypedUserReporter()), [
+            pyarrow.int64(), pyarrow.string(), pyarrow.bool_(),
+            pyarrow.timestamp('us'), pyarrow.string(), pyarrow.int64(),
+            pyarrow.string(),
+        ])
+
+    def test_write_parquet(self):
+        import pyarrow.parquet
+        fh = io.BytesIO()
+
+        count = write_columnar(TypedUserReporter(), fh, row_group_size=2)
+
+        self.assertEqual(count, 3)
+        parquet_file = pyarrow.parquet.ParquetFile(io.BytesIO(fh.getvalue()))
+        self.assertEqual(parquet_file.num_row_groups, 2)
+        data = parquet_file.read().to_pydict()
+        self.assertEqual(data['username'], [u'foo1', u'foo2', u'foo3'])
+        self.assertEqual(data['is_staff'], [False, True, False])
+        self.assertEqual(data['date_joined'][0], datetime.datetime(2014, 6, 1))
+        self.assertEqual(data['groups'], [u'Night watch'] * 3)
+        self.assertEqual(data['name_length'], [4, 4, 4])
+        self.assertEqual(data['full_name'], [u'J\xf3n Snow'] * 3)
+
+    def test_write_arrow_stream(self):
+        fh = io.BytesIO()
+
+        write_columnar(TypedUserReporter(visible_fields=('id', 'username')), fh,
+                       format=ARROW, row_group_size=2)
+
+        reader = pyarrow.ipc.open_stream(fh.getvalue())
+        batches = [batch for batch in reader]
+        self.assertEqual([batch.num_rows for batch in batches], [2, 1])
+        self.assertEqual(reader.schema.names, ['id', 'username'])
+        self.assertEqual(batches[1].to_pydict()['username'], [u'foo3'])
+
+    def test_batch_column_types(self):
+        class TypedBatchPermissionReporter(BatchPermissionReporter):
+            @column_type('int64')
+            def get_codename_column_batch(self, values):
+                return [len(value) for value in values]
+
+        reporter = TypedBatchPermissionReporter(
+            Permission.objects.filter(codename='add_permission'))
+        self.assertEqual(get_column_types(reporter), [pyarrow.string(), pyarrow.int64()])
+
+        fh = io.BytesIO()
+        write_columnar(reporter, fh, format=ARROW)
+
+        data = pyarrow.ipc.open_stream(fh.getvalue()).read_all().to_pydict()
+        self.assertEqual(data['id'], [u'#1'])
+        self.assertEqual(data['codename'], [14])
+
+    def test_unknown_format(self):
+        self.assertRaises(ValueError, write_columnar, TypedUserReporter(),
+                          io.BytesIO(), format='csv')
+
+
+class InstrumentationTestCase(TestCase):
+
+    def _get_queryset(self):
+        return Permission.objects.filter(
+            content_type=ContentType.objects.get_for_model(Permission))
+
+    def test_reporter_metrics(self):
+        callback, receiver = Mock(), Mock()
+        report_finished.connect(receiver)
+        self.addCleanup(report_finished.disconnect, receiver)
+        instrument = ReportInstrument(callbacks=[callback])
+        reporter = PermissionReporterWithSomeFieldsAndCustomRenderer(self._get_queryset())
+        reporter.instrument = instrument
+
+        rows = list(reporter.get_rows())
+
+        self.assertEqual(len(rows), 3)
+        metrics = instrument.metrics
+        callback.assert_called_once_with(instrument, metrics)
+        receiver.assert_called_once_with(
+            signal=report_finished,
+            sender=PermissionReporterWithSomeFieldsAndCustomRenderer,
+            reporter=reporter, metrics=metrics)
+        self.assertEqual(metrics.rows, 3)
+        self.assertEqual(metrics.queries, 1)
+        self.assertGreater(metrics.render_time, 0)
+        self.assertEqual(sorted(metrics.column_times), ['codename', 'name'])
+        self.assertEqual(metrics.column_times['codename'][1], 3)
+        self.assertEqual([name for name, _ in metrics.get_slowest_columns(1)],
+                         [metrics.get_slowest_columns()[0][0]])
+        self.assertEqual(metrics.as_dict()['rows'], 3)
+
+    def test_sampled_columns(self):
+        instrument = ReportInstrument(sample_every=2)
+        reporter = PermissionReporterWithSomeFields(self._get_queryset())
+        reporter.instrument = instrument
+
+        list(reporter.get_rows())
+
+        self.assertEqual(instrument.metrics.rows, 3)
+        self.assertEqual(instrument.metrics.column_times['name'][1], 2)
+
+    def test_uninstrumented_renderers(self):
+        reporter = PermissionReporterWithSomeFieldsAndCustomRenderer()
+
+        self.assertEqual(reporter.get_column_renderers()[1],
+                         reporter.get_codename_column)
+
+    def test_view_metrics(self):
+        callback = Mock()
+        view = BaseCSVGeneratorView()
+        view.reporter_class = PermissionReporterWithSomeFields
+        view.queryset = self._get_queryset()
+        view.instrument_class = lambda: ReportInstrument(callbacks=[callback])
+        view.writer_class = BufferedUnicodeWriter
+        request = RequestFactory().get('/')
+
+        content = view.get(request).content
+        metrics = callback.call_args[0][1]
+        self.assertEqual(metrics.bytes, len(content))
+        self.assertEqual(metrics.rows, 3)
+        self.assertEqual(metrics.queries, 1)
+        self.assertLessEqual(metrics.time_to_first_byte, metrics.total_time)
+
+        callback.reset_mock()
+        view.streaming = True
+        response = view.get(request)
+        self.assertFalse(callback.called)
+        streamed = ''.join(response.streaming_content)
+        metrics = callback.call_args[0][1]
+        self.assertEqual(streamed, content)
+        self.assertEqual(metrics.bytes, len(content))
+        self.assertEqual(metrics.rows, 3)
+        self.assertGreaterEqual(metrics.encode_time, 0)
+        self.assertLess(metrics.time_to_first_byte, metrics.total_time)
+
+    def test_failed_view_restores_the_debug_cursor(self):
+        from django.db import connection
+        callback = Mock()
+        view = BaseCSVGeneratorView()
+        view.reporter_class = PermissionReporterWithSomeFields
+        view.queryset = self._get_queryset()
+        view.instrument_class = lambda: ReportInstrument(callbacks=[callback])
+        view.write_csv = Mock(side_effect=RuntimeError)
+        request = RequestFactory().get('/')
+        use_debug_cursor = connection.use_debug_cursor
+
+        self.assertRaises(RuntimeError, view.get, request)
+        self.assertEqual(connection.use_debug_cursor, use_debug_cursor)
+
+        # streamed responses that are never sent
+        view.streaming = True
+        view.get(request).close()
+        self.assertEqual(connection.use_debug_cursor, use_debug_cursor)
+        self.assertFalse(callback.called)
+
+    def test_failed_stream_sends_no_metrics(self):
+        from django.db import connection
+
+        class FailingPermissionReporter(PermissionReporterWithSomeFields):
+            def get_codename_column(self, instance):
+                raise RuntimeError
+
+        callback, receiver = Mock(), Mock()
+        report_finished.connect(receiver)
+        self.addCleanup(report_finished.disconnect, receiver)
+        view = BaseCSVGeneratorView()
+        view.reporter_class = FailingPermissionReporter
+        view.queryset = self._get_queryset()
+        view.instrument_class = lambda: ReportInstrument(callbacks=[callback])
+        view.streaming = True
+        request = RequestFactory().get('/')
+        use_debug_cursor = connection.use_debug_cursor
+
+        response = view.get(request)
+        self.assertRaises(RuntimeError, list, response.streaming_content)
+        self.assertEqual(connection.use_debug_cursor, use_debug_cursor)
+        self.assertFalse(callback.called)
+        self.assertFalse(receiver.called)
+
+        # streams closed by the client before they're finished
+        view.reporter_class = PermissionReporterWithSomeFields
+        response = view.get(request)
+        next(iter(response.streaming_content))
+        response.close()
+        self.assertEqual(connection.use_debug_cursor, use_debug_cursor)
+        self.assertFalse(callback.called)
+        self.assertFalse(receiver.called)
@@ -1,7 +1,17 @@
 # From Python's documentation:
 # https://docs.python.org/2/library/csv.html
 
-import csv, codecs, cStringIO
+import csv, codecs, cStringIO, os, stat, zlib
+from collections import OrderedDict
+from itertools import islice
+
+GZIP = 'gzip'
+DEFLATE = 'deflate'
+
+# the umask can only be read by replacing it, so it's read once on import,
+# before any thread could be creating files
+_UMASK = os.umask(0)
+os.umask(_UMASK)
 
 class UnicodeWriter:  # pragma: no cover
     """
@@ -31,3 +41,213 @@ class UnicodeWriter:  # pragma: no cover
     def writerows(self, rows):
         for row in rows:
             self.writerow(row)
+
+
+def _encode_cell(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def _encode_row(row):
+    try:
+        # rows are usually made of unicode strings only
+        return [s.encode('utf-8') for s in row]
+    except (AttributeError, UnicodeDecodeError):
+        return [_encode_cell(s) for s in row]
+
+
+class BufferedUnicodeWriter(object):
+    """
+    A CSV writer with the same API as `UnicodeWriter`, that formats the rows
+    into a buffer and encodes and writes them to "f" once per batch of
+    `batch_size` rows.
+
+    Rows written with `writerow` may stay in the buffer, so `close()` needs
+    to be called once all rows are written. It doesn't close "f".
+    """
+
+    def __init__(self, f, dialect=csv.excel, encoding="utf-8", batch_size=1000, **kwds):
+        self.queue = cStringIO.StringIO()
+        self.writer = csv.writer(self.queue, dialect=dialect, **kwds)
+        self.stream = f
+        self.batch_size = batch_size
+        self.pending = 0
+        if codecs.lookup(encoding).name == 'utf-8':
+            # rows are formatted as UTF-8 already
+            self.encoder = None
+        else:
+            self.encoder = codecs.getincrementalencoder(encoding)()
+
+    def writerow(self, row):
+        self.writer.writerow(_encode_row(row))
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def writerows(self, rows):
+        for batch in batched(rows, self.batch_size):
+            self.writer.writerows([_encode_row(row) for row in batch])
+            self.pending += len(batch)
+            self.flush()
+
+    def flush(self):
+        data = self.queue.getvalue()
+        if not data:
+            return
+        if self.encoder is not None:
+            data = self.encoder.encode(data.decode("utf-8"))
+        self.stream.write(data)
+        self.queue.seek(0)
+        self.queue.truncate()
+        self.pending = 0
+
+    def close(self):
+        self.flush()
+
+
+def get_file_mode(path):
+    """
+    Returns the permissions of the file in `path`, or the ones a new file
+    gets from the umask if it doesn't exist. Temporary files are created
+    owner-only, so files renamed into place need them set
+    """
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        return 0666 & ~_UMASK
+
+
+def close_writer(writer):
+    """
+    Lets writers buffering their output, like `BufferedUnicodeWriter`, write
+    what's left
+    """
+    close = getattr(writer, 'close', None)
+    if close is not None:
+        close()
+
+
+def batched(iterable, size):
+    """
+    Splits `iterable` into lists of at most `size` items
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def get_compressor(encoding, level=6):
+    """
+    Returns a zlib compressor for the `gzip` or `deflate` HTTP encodings
+    """
+    if encoding == GZIP:
+        wbits = 16 + zlib.MAX_WBITS
+    elif encoding == DEFLATE:
+        wbits = zlib.MAX_WBITS
+    else:
+        raise ValueError('Unknown encoding %r' % encoding)
+    return zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+
+class CompressedStream(object):
+    """
+    File-like object compressing everything written into it before writing
+    it into "f". `close()` writes what's left, but doesn't close "f".
+    """
+
+    def __init__(self, f, encoding=GZIP, level=6):
+        self.stream = f
+        self.compressor = get_compressor(encoding, level)
+
+    def write(self, data):
+        data = self.compressor.compress(data)
+        if data:
+            self.stream.write(data)
+
+    def close(self):
+        self.stream.write(self.compressor.flush())
+
+
+def compress_chunks(chunks, encoding=GZIP, level=6):
+    """
+    Compresses an iterable of strings. Every chunk is flushed, so the
+    compressed data is sent as soon as its chunk is available
+    """
+    compressor = get_compressor(encoding, level)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class LRUCache(object):
+    """
+    Dictionary-like cache keeping up to `max_size` items, discarding the
+    least recently used ones first. Keeps count of its hits and misses.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        try:
+            value = self._items.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        # move it to the end, as the most recently used
+        self._items[key] = value
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._items.pop(key, None)
+        self._items[key] = value
+        if len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+
+    def get_stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate,
+            'size': len(self),
+            'max_size': self.max_size,
+        }
+
+
+def iter_file_range(f, start, end, block_size=64 * 1024):
+    """
+    Yields the bytes of the file "f" from `start` up to `end` (not included)
+    in blocks of `block_size` bytes, closing it at the end
+    """
+    try:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            data = f.read(min(block_size, remaining))
+            if not data:
+                return
+            remaining -= len(data)
+            yield data
+    finally:
+        f.close()
@@ -1,12 +1,32 @@
-from django.http import HttpResponse
+import io, itertools, os
+from wsgiref.util import FileWrapper
+
+from django.db.models.query import QuerySet
+from django.http import (
+    HttpResponse, HttpResponseBadRequest, StreamingHttpResponse)
+from django.utils.cache import patch_vary_headers
 from django.views.generic import ListView
 
-from .utils import UnicodeWriter
+from .cache import CACHED_HEADERS
+from .jobs import PENDING, get_row_range
+from .utils import (
+    DEFLATE, GZIP, CompressedStream, UnicodeWriter, batched, close_writer,
+    compress_chunks, iter_file_range)
+from .xlsx import XLSXWriter
 
 
 class BaseCSVGeneratorView(ListView):
     writer_class = UnicodeWriter
     file_name = 'myreport.csv'
+    content_type = 'text/csv'
+    raw_values = False
+    streaming = False
+    stream_batch_size = 1000
+    compress = False
+    gzip_attachment = False
+    instrument_class = None
+    # the instrument measuring the current request, if any
+    instrument = None
 
     def get_reporter_class(self):
         return self.reporter_class
@@ -21,22 +41,372 @@ class BaseCSVGeneratorView(ListView):
     def should_write_header(self):
         return getattr(self, 'WRITE_HEADER', True)
 
+    def should_stream(self):
+        return self.streaming
+
+    def get_instrument(self):
+        """
+        Returns a new `reportato.instrumentation.ReportInstrument` to measure
+        the report, or None
+        """
+        if self.instrument_class is None:
+            return None
+        return self.instrument_class()
+
+    def instrument_report(self, reporter, writer):
+        """
+        Sets the current instrument, if any, on the reporter and writer of
+        the report
+        """
+        if self.instrument is None:
+            return writer
+        reporter.instrument = self.instrument
+        return self.instrument.wrap_writer(writer)
+
+    def get_report_rows(self, reporter):
+        if self.raw_values:
+            return reporter.get_raw_rows()
+        return reporter.get_rows()
+
     def write_csv(self, fh):
         writer_class = self.get_writer_class()
-        writer = writer_class(fh)
         reporter = self.get_reporter()
+        writer = self.instrument_report(reporter, writer_class(fh))
 
         if self.should_write_header():
             writer.writerow(reporter.get_header_row())
 
-        writer.writerows(reporter.get_rows())
+        writer.writerows(self.get_report_rows(reporter))
+        self.close_writer(writer)
+
+    def close_writer(self, writer):
+        """
+        Lets writers buffering their output write what's left
+        """
+        close_writer(writer)
+
+    def stream_csv(self):
+        """
+        Generator that writes the report in batches of `stream_batch_size`
+        rows, yielding the encoded content after each one of them
+        """
+        buffer = io.BytesIO()
+        writer_class = self.get_writer_class()
+        reporter = self.get_reporter()
+        writer = self.instrument_report(reporter, writer_class(buffer))
+
+        def drain():
+            data = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return data
+
+        if self.should_write_header():
+            # send the header on its own, so the first bytes go out straight away
+            writer.writerows([reporter.get_header_row()])
+            yield drain()
+
+        for rows in batched(self.get_report_rows(reporter), self.stream_batch_size):
+            writer.writerows(rows)
+            data = drain()
+            if data:
+                yield data
+
+        self.close_writer(writer)
+        data = drain()
+        if data:
+            yield data
 
     def get_file_name(self):
         return self.file_name
 
+    def get_content_encoding(self, request):
+        """
+        Returns the encoding to compress the response with, if any, based
+        on the Accept-Encoding header
+        """
+        if not self.compress:
+            return None
+
+        accepted = set()
+        for coding in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+            params = [param.strip() for param in coding.lower().split(';')]
+            if 'q=0' in params or 'q=0.0' in params:
+                continue
+            accepted.add(params[0])
+
+        for encoding in (GZIP, DEFLATE):
+            if encoding in accepted:
+                return encoding
+        return None
+
     def get(self, request, *args, **kwargs):
-        response = HttpResponse(content_type='text/csv')
+        content_type = self.content_type
+        file_name = self.get_file_name()
+        content_encoding = self.get_content_encoding(request)
+        compression = content_encoding
+        if self.gzip_attachment:
+            # the file itself is gzipped, rather than the response
+            content_type, file_name = 'application/gzip', file_name + '.gz'
+            content_encoding, compression = None, GZIP
+
+        instrument = self.instrument = self.get_instrument()
+        if instrument is not None:
+            instrument.start(using=self.get_queryset().db)
+
+        if self.should_stream():
+            content = self.stream_csv()
+            if compression:
+                content = compress_chunks(content, compression)
+            if instrument is not None:
+                content = instrument.track_chunks(content)
+            response = StreamingHttpResponse(content, content_type=content_type)
+            response['Content-Disposition'] = 'attachment; filename="%s"' % file_name
+        else:
+            response = HttpResponse(content_type=content_type)
+            response['Content-Disposition'] = 'attachment; filename="%s"' % file_name
+            fh = response if instrument is None else instrument.wrap_stream(response)
+            try:
+                if compression:
+                    stream = CompressedStream(fh, compression)
+                    self.write_csv(stream)
+                    stream.close()
+                else:
+                    self.write_csv(fh)
+                if instrument is not None:
+                    # nothing is sent until the whole report is written
+                    instrument.mark_first_byte()
+                    instrument.finish()
+            finally:
+                if instrument is not None:
+                    # failed reports restore the connection's debug cursor
+                    instrument.stop()
+
+        if content_encoding:
+            response['Content-Encoding'] = content_encoding
+        if self.compress and not self.gzip_attachment:
+            patch_vary_headers(response, ('Accept-Encoding',))
+
+        return response
+
+
+class BaseXLSXGeneratorView(BaseCSVGeneratorView):
+    """
+    Same as `BaseCSVGeneratorView`, but generating an Excel file with typed
+    cells for numbers, booleans and dates
+    """
+    writer_class = XLSXWriter
+    file_name = 'myreport.xlsx'
+    content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    raw_values = True
+
+
+def _parse_range(header, size):
+    """
+    Returns the first and last byte of a single range `Range` header. Returns
+    None for headers that should be ignored, like multiple ranges
+    """
+    units, _, byte_range = header.partition('=')
+    if units.strip().lower() != 'bytes' or ',' in byte_range:
+        return None
+
+    first, separator, last = byte_range.strip().partition('-')
+    if not separator:
+        return None
+    try:
+        if not first:
+            # the last N bytes
+            return max(size - int(last), 0) if int(last) else size, size - 1
+        first = int(first)
+        last = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if first > last and first < size:
+        return None
+    return first, last
+
+
+def _parse_row_range(value):
+    """
+    Parses ranges of rows like "100-199", or "100-" for every row after
+    the 100th
+    """
+    first, separator, last = value.partition('-')
+    if not separator:
+        raise ValueError('Invalid range of rows %r' % value)
+    return int(first), int(last) if last else float('inf')
+
+
+class BackgroundReportMixin(object):
+    """
+    Mixin for `BaseCSVGeneratorView` generating the report in the background
+    with the `reportato.jobs.ReportJobManager` in `report_jobs`. Responds
+    with a 202 "pending" response until the report is ready, and then
+    serves the stored file.
+
+    The report is generated with the queryset
+    `model._default_manager.filter(**self.get_report_filters())`.
+
+    Stored files are served with an ETag and support `Range` and `If-Range`
+    requests, so interrupted downloads can be resumed. A range of rows can
+    be requested with the `rows_parameter` query parameter, e.g.
+    `?rows=100-199` for the rows 100 to 199 (starting from 0) with the header.
+    """
+    report_jobs = None
+    rows_parameter = 'rows'
+
+    def get_report_jobs(self):
+        return self.report_jobs
+
+    def get_report_filters(self):
+        return {}
+
+    def get_visible_fields(self):
+        return None
+
+    def get(self, request, *args, **kwargs):
+        jobs = self.get_report_jobs()
+        report = (self.get_reporter_class(), self.get_report_filters(),
+                  self.get_visible_fields())
+
+        if jobs.request(*report) == PENDING:
+            return HttpResponse(PENDING, status=202, content_type='text/plain')
+
+        if self.rows_parameter in request.GET:
+            return self.get_rows_response(request, jobs, report)
+
+        fh, size, etag = jobs.open_report(*report)
+        byte_range = None
+        if 'HTTP_RANGE' in request.META and \
+                request.META.get('HTTP_IF_RANGE', etag) == etag:
+            byte_range = _parse_range(request.META['HTTP_RANGE'], size)
+
+        if byte_range is None:
+            response = StreamingHttpResponse(FileWrapper(fh),
+                                             content_type=self.content_type)
+            response['Content-Length'] = size
+        elif byte_range[0] >= size:
+            fh.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%d' % size
+        else:
+            first, last = byte_range
+            response = StreamingHttpResponse(
+                iter_file_range(fh, first, last + 1),
+                status=206, content_type=self.content_type)
+            response['Content-Range'] = 'bytes %d-%d/%d' % (first, last, size)
+            response['Content-Length'] = last + 1 - first
+
+        response['ETag'] = etag
+        response['Accept-Ranges'] = 'bytes'
+        response['Content-Disposition'] = 'attachment; filename="%s"' % self.get_file_name()
+        return response
+
+    def get_rows_response(self, request, jobs, report):
+        """
+        Serves the header and the range of rows requested with the
+        `rows_parameter`, using the index of the stored report
+        """
+        fh, size, _ = jobs.open_report(*report)
+        index = jobs.get_index(*report, size=size)
+        if index is None:
+            fh.close()
+            return HttpResponseBadRequest('This report has no index of rows')
+
+        try:
+            first, last = _parse_row_range(request.GET[self.rows_parameter])
+            start, end = get_row_range(fh, index, first, last)
+        except ValueError as error:
+            fh.close()
+            return HttpResponseBadRequest(unicode(error))
+
+        header_size = index['offsets'][0]
+        fh.seek(0)
+        content = [fh.read(header_size)] if header_size else []
+        response = StreamingHttpResponse(
+            itertools.chain(content, iter_file_range(fh, start, end)),
+            content_type=self.content_type)
+        response['Content-Length'] = header_size + end - start
         response['Content-Disposition'] = 'attachment; filename="%s"' % self.get_file_name()
-        self.write_csv(response)
+        return response
+
+
+def _watch_reports(report_cache, reporter_class):
+    if report_cache is not None and reporter_class is not None:
+        report_cache.watch_reporter(reporter_class)
+
+
+class CachedReportMixinMetaclass(type):
+    """
+    Connects the invalidation of the cached reports of a view as soon as its
+    class is defined
+    """
+
+    def __init__(cls, name, bases, attrs):
+        super(CachedReportMixinMetaclass, cls).__init__(name, bases, attrs)
+        _watch_reports(getattr(cls, 'report_cache', None),
+                       getattr(cls, 'reporter_class', None))
+
+
+class CachedReportMixin(object):
+    """
+    Mixin for `BaseCSVGeneratorView` serving reports from the
+    `reportato.cache` report cache in `report_cache`. Reports are cached by
+    reporter class, visible fields and queryset, and invalidated whenever
+    an instance of the model of the reporter is saved or deleted, or its
+    many to many relations change.
+
+    The invalidation of `reporter_class` is set up when the view class is
+    defined, or with `as_view()`. Views picking their reporter class in
+    `get_reporter_class()` need to call `report_cache.watch_reporter()`.
+
+    Reports of lists of objects, rather than querysets, are never cached.
+    """
+    __metaclass__ = CachedReportMixinMetaclass
+    report_cache = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        _watch_reports(initkwargs.get('report_cache', cls.report_cache),
+                       initkwargs.get('reporter_class', getattr(cls, 'reporter_class', None)))
+        return super(CachedReportMixin, cls).as_view(**initkwargs)
+
+    def get_report_cache(self):
+        return self.report_cache
+
+    def get_report_cache_key(self, report_cache, reporter, request):
+        view_class = type(self)
+        # gzipped attachments are the same whatever the accepted encodings
+        content_encoding = None if self.gzip_attachment else self.get_content_encoding(request)
+        return report_cache.get_key(
+            reporter, '%s.%s' % (view_class.__module__, view_class.__name__),
+            content_encoding)
+
+    def get(self, request, *args, **kwargs):
+        report_cache = self.get_report_cache()
+        reporter = self.get_reporter()
+        if report_cache is None or not isinstance(reporter.items, QuerySet):
+            return super(CachedReportMixin, self).get(request, *args, **kwargs)
+
+        key = self.get_report_cache_key(report_cache, reporter, request)
+        entry = report_cache.get(key)
+        if entry is not None:
+            headers, fh = entry
+            fh.seek(0, os.SEEK_END)
+            size = fh.tell()
+            fh.seek(0)
+            response = StreamingHttpResponse(FileWrapper(fh))
+            for name, value in headers.items():
+                response[name] = value
+            response['Content-Length'] = size
+            return response
 
+        response = super(CachedReportMixin, self).get(request, *args, **kwargs)
+        headers = dict((name, response[name]) for name in CACHED_HEADERS
+                       if response.has_header(name))
+        if response.streaming:
+            response.streaming_content = report_cache.cache_chunks(
+                key, headers, response.streaming_content)
+        else:
+            report_cache.set(key, headers, response.content)
         return response
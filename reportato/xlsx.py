@@ -0,0 +1,244 @@
+"""
+Streaming XLSX writer. Rows are written as sheet XML straight into a zip
+stream as they arrive, so memory usage doesn't depend on the number of rows.
+
+It has the same API as the CSV writers, so it can be used as the
+`writer_class` of a view, but `close()` needs to be called once all rows
+are written. Numbers, booleans and dates are written as typed cells, so it's
+better used with `ModelReporter.get_raw_rows()`.
+
+Files bigger than 4GB are not supported, as ZIP64 isn't implemented.
+"""
+import datetime, re, struct, time, zlib
+from decimal import Decimal
+from xml.sax.saxutils import escape, quoteattr
+
+from django.utils import timezone
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '%s'
+    '</Types>'
+)
+SHARED_STRINGS_CONTENT_TYPE = (
+    '<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+)
+ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name=%s sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '%s'
+    '</Relationships>'
+)
+SHARED_STRINGS_REL = (
+    '<Relationship Id="rId3" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>'
+)
+# cell styles: 0 is the default one, 1 dates, 2 date times and 3 times
+STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="2">'
+    '<numFmt numFmtId="164" formatCode="yyyy\\-mm\\-dd"/>'
+    '<numFmt numFmtId="165" formatCode="yyyy\\-mm\\-dd hh:mm:ss"/>'
+    '</numFmts>'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="4">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="21" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '</cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetData>'
+)
+SHEET_END = '</sheetData></worksheet>'
+
+EPOCH = datetime.datetime(1899, 12, 30)
+# characters that aren't allowed in XML 1.0
+INVALID_XML_CHARS = re.compile(u'[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+
+class ZipStream(object):
+    """
+    Minimal zip writer for non seekable streams. Entries are deflated as
+    they are written, and their sizes and checksums are written after their
+    data
+    """
+
+    def __init__(self, fh, compression_level=6):
+        self.fh = fh
+        self.compression_level = compression_level
+        self.offset = 0
+        self.entries = []
+        self.current = None
+        now = time.localtime()
+        self.dos_time = (now.tm_hour << 11) | (now.tm_min << 5) | (now.tm_sec // 2)
+        self.dos_date = ((now.tm_year - 1980) << 9) | (now.tm_mon << 5) | now.tm_mday
+
+    def _write(self, data):
+        self.fh.write(data)
+        self.offset += len(data)
+
+    def start_entry(self, name):
+        self.current = {
+            'name': name, 'offset': self.offset, 'crc': 0, 'size': 0,
+            'compressed_size': 0,
+            'compressor': zlib.compressobj(self.compression_level, zlib.DEFLATED, -zlib.MAX_WBITS),
+        }
+        self._write(struct.pack(
+            '<IHHHHHIIIHH', 0x04034b50, 20, 0x08, 8, self.dos_time,
+            self.dos_date, 0, 0, 0, len(name), 0) + name)
+
+    def write(self, data):
+        entry = self.current
+        entry['crc'] = zlib.crc32(data, entry['crc'])
+        entry['size'] += len(data)
+        compressed = entry['compressor'].compress(data)
+        if compressed:
+            entry['compressed_size'] += len(compressed)
+            self._write(compressed)
+
+    def end_entry(self):
+        entry = self.current
+        compressed = entry.pop('compressor').flush()
+        entry['compressed_size'] += len(compressed)
+        entry['crc'] &= 0xffffffff
+        self._write(compressed)
+        self._write(struct.pack('<IIII', 0x08074b50, entry['crc'],
+                                entry['compressed_size'], entry['size']))
+        self.entries.append(entry)
+        self.current = None
+
+    def writestr(self, name, data):
+        self.start_entry(name)
+        self.write(data)
+        self.end_entry()
+
+    def close(self):
+        start = self.offset
+        for entry in self.entries:
+            self._write(struct.pack(
+                '<IHHHHHHIIIHHHHHII', 0x02014b50, 20, 20, 0x08, 8,
+                self.dos_time, self.dos_date, entry['crc'],
+                entry['compressed_size'], entry['size'], len(entry['name']),
+                0, 0, 0, 0, 0, entry['offset']) + entry['name'])
+        self._write(struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, len(self.entries),
+                                len(self.entries), self.offset - start, start, 0))
+
+
+def _string_cell(value):
+    value = INVALID_XML_CHARS.sub(u'', value)
+    if value != value.strip():
+        return u'<c t="inlineStr"><is><t xml:space="preserve">%s</t></is></c>' % escape(value)
+    return u'<c t="inlineStr"><is><t>%s</t></is></c>' % escape(value)
+
+
+class XLSXWriter(object):
+    """
+    Writes rows into a single sheet XLSX file written to "f". Strings are
+    written inline, unless `shared_strings` is set, in which case every
+    distinct string is kept in memory until the file is closed.
+    """
+
+    def __init__(self, f, shared_strings=False, sheet_name='Report', compression_level=6):
+        self.zip = ZipStream(f, compression_level)
+        self.shared_strings = {} if shared_strings else None
+        self.zip.writestr('[Content_Types].xml',
+                          CONTENT_TYPES % (SHARED_STRINGS_CONTENT_TYPE if shared_strings else ''))
+        self.zip.writestr('_rels/.rels', ROOT_RELS)
+        self.zip.writestr('xl/workbook.xml',
+                          WORKBOOK % quoteattr(sheet_name).encode('utf-8'))
+        self.zip.writestr('xl/_rels/workbook.xml.rels',
+                          WORKBOOK_RELS % (SHARED_STRINGS_REL if shared_strings else ''))
+        self.zip.writestr('xl/styles.xml', STYLES)
+        self.zip.start_entry('xl/worksheets/sheet1.xml')
+        self.zip.write(SHEET_START)
+
+    def _cell(self, value):
+        if value is None:
+            return u'<c/>'
+        if isinstance(value, basestring):
+            if isinstance(value, str):
+                value = value.decode('utf-8')
+            if self.shared_strings is None:
+                return _string_cell(value)
+            index = self.shared_strings.setdefault(value, len(self.shared_strings))
+            return u'<c t="s"><v>%d</v></c>' % index
+        if isinstance(value, bool):
+            return u'<c t="b"><v>%d</v></c>' % value
+        if isinstance(value, (int, long, Decimal)):
+            return u'<c><v>%s</v></c>' % value
+        if isinstance(value, float):
+            if value != value or value in (float('inf'), float('-inf')):
+                return _string_cell(unicode(value))
+            return u'<c><v>%r</v></c>' % value
+        if isinstance(value, datetime.datetime):
+            if timezone.is_aware(value):
+                value = timezone.make_naive(value, timezone.get_current_timezone())
+            delta = value - EPOCH
+            serial = delta.days + (delta.seconds + delta.microseconds / 1e6) / 86400.0
+            return u'<c s="2"><v>%r</v></c>' % serial
+        if isinstance(value, datetime.date):
+            return u'<c s="1"><v>%d</v></c>' % (value - EPOCH.date()).days
+        if isinstance(value, datetime.time):
+            seconds = value.hour * 3600 + value.minute * 60 + value.second
+            return u'<c s="3"><v>%r</v></c>' % ((seconds + value.microsecond / 1e6) / 86400.0)
+        return self._cell(unicode(value))
+
+    def _row(self, row):
+        return u'<row>%s</row>' % u''.join([self._cell(value) for value in row])
+
+    def writerow(self, row):
+        self.zip.write(self._row(row).encode('utf-8'))
+
+    def writerows(self, rows):
+        # one write for the whole batch, so it's compressed in one go
+        self.zip.write(u''.join([self._row(row) for row in rows]).encode('utf-8'))
+
+    def close(self):
+        self.zip.write(SHEET_END)
+        self.zip.end_entry()
+
+        if self.shared_strings is not None:
+            strings = sorted(self.shared_strings, key=self.shared_strings.get)
+            self.zip.start_entry('xl/sharedStrings.xml')
+            self.zip.write(
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                'uniqueCount="%d">' % len(strings))
+            for value in strings:
+                value = INVALID_XML_CHARS.sub(u'', value)
+                self.zip.write((u'<si><t xml:space="preserve">%s</t></si>' % escape(value)).encode('utf-8'))
+            self.zip.write('</sst>')
+            self.zip.end_entry()
+
+        self.zip.close()
@@ -24,6 +24,7 @@ setup(
     license="BSD",
     keywords="django reports potato csv",
     url='https://github.com/potatolondon/reportato',
-    packages=['reportato'],
+    packages=['reportato', 'reportato.management',
+              'reportato.management.commands'],
     zip_safe=False,
 )